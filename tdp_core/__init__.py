@@ -56,6 +56,9 @@ class VisynPlugin(AVisynPlugin):
         registry.append("namespace", "tdp_core", "tdp_core.proxy", {"namespace": "/api/tdp/proxy"})
 
         registry.append("namespace", "db_connector", "tdp_core.sql", {"namespace": "/api/tdp/db"})
+        registry.append("after_server_started", "db_connector_warm_up", "tdp_core.db", {"factory": "create_warm_up"})
+        # mounted at a separate prefix as the namespace above takes precedence over routers with the same prefix
+        registry.append_router("db_connector_async", "tdp_core.sql_async", {})
 
         registry.append(
             "namespace",
@@ -0,0 +1,233 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from opentelemetry import metrics
+from visyn_core import manager
+from werkzeug.exceptions import ServiceUnavailable
+
+from .settings import get_settings
+
+_log = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+# priority classes of the views, queued requests of a higher class are admitted first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+_controllers: dict[str, "AdmissionController"] = {}
+_controllers_lock = threading.Lock()
+
+wait_histogram = meter.create_histogram(
+    name="tdp_db_admission_wait_seconds", description="Time requests waited for a free slot of the connector", unit="s"
+)
+rejected_counter = meter.create_counter(
+    name="tdp_db_admission_rejected_total", description="Number of requests rejected because the connector is overloaded", unit="1"
+)
+
+
+class OverloadedError(Exception):
+    pass
+
+
+class AdmissionController:
+    """
+    limits the number of concurrent queries of a connector. Requests exceeding the limit wait in a bounded queue which is ordered by
+    priority class and arrival, requests which don't fit into the queue or wait too long are rejected.
+    """
+
+    def __init__(self, max_concurrent=25, max_queue=100, queue_timeout=10.0):
+        """
+        :param max_concurrent: maximal number of admitted requests, should be less than the pool size of the engine
+        :param max_queue: maximal number of waiting requests
+        :param queue_timeout: maximal number of seconds a request waits for a slot
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._waiters: list[list] = []  # heap of [priority, sequence, event, cancelled, slots]
+        self._sequence = itertools.count()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self, priority="normal", slots=1):
+        """
+        waits for free slots
+        :param priority: priority class, see PRIORITIES
+        :param slots: number of slots, e.g. the number of connections the request uses concurrently
+        :return: the seconds waited
+        :raises OverloadedError: if the queue is full or the request timed out while waiting
+        """
+        slots = min(slots, self.max_concurrent)
+        with self._lock:
+            if self.active + slots <= self.max_concurrent and not self.queued:
+                self.active += slots
+                self.admitted += 1
+                return 0.0
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise OverloadedError("queue full")
+            waiter = [PRIORITIES.get(priority, PRIORITIES["normal"]), next(self._sequence), threading.Event(), False, slots]
+            heapq.heappush(self._waiters, waiter)
+            self.queued += 1
+
+        start = time.monotonic()
+        waiter[2].wait(self.queue_timeout)
+        waited = time.monotonic() - start
+        with self._lock:
+            if not waiter[2].is_set():  # timed out, the slots might have been handed over in the meantime
+                waiter[3] = True
+                self.queued -= 1
+                self.rejected += 1
+                self.timeouts += 1
+                self._hand_over()  # the cancelled waiter might have blocked the ones behind it
+                raise OverloadedError("timeout")
+            self.admitted += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+        return waited
+
+    def release(self, slots=1):
+        """
+        frees the slots by handing them over to the next waiting requests
+        :param slots: number of slots given to acquire
+        """
+        with self._lock:
+            self.active -= min(slots, self.max_concurrent)
+            self._hand_over()
+
+    def _hand_over(self):
+        # admits the waiting requests in order as long as their slots are free, has to be called with the lock held
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter[3]:
+                heapq.heappop(self._waiters)
+                continue
+            if self.active + waiter[4] > self.max_concurrent:
+                return
+            heapq.heappop(self._waiters)
+            self.queued -= 1
+            self.active += waiter[4]
+            waiter[2].set()
+
+    def retry_after(self):
+        """
+        :return: estimated seconds until the queue drained, used as Retry-After header
+        """
+        average = self.wait_time / self.admitted if self.admitted else 0
+        return max(1, int(average * (self.queued + 1) / max(1, self.max_concurrent)) + 1)
+
+    def stats(self):
+        """
+        :return: dict with the current number of active slots, queued requests and the counters
+        """
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_time": (self.wait_time / self.admitted) if self.admitted else 0.0,
+            "max_wait_time": self.max_wait_time,
+        }
+
+
+def controller(database):
+    """
+    returns the lazily created admission controller of the given connector, its options can be overridden by the `admission` dict of the
+    connector config
+    :return: the controller or None if admission control is disabled
+    """
+    if database in _controllers:
+        return _controllers[database]
+    with _controllers_lock:
+        if database not in _controllers:
+            options = get_settings().db.admission.dict()
+            connector = manager.db.connectors.get(database)
+            options.update(getattr(connector, "admission", None) or {})
+            enabled = options.pop("enabled")
+            _controllers[database] = AdmissionController(**options) if enabled else None
+    return _controllers[database]
+
+
+def acquire(database, priority="normal", slots=1):
+    """
+    acquires slots of the given connector, which have to be released by calling the returned function exactly once
+    :param slots: number of slots, e.g. the number of connections the request uses concurrently
+    :return: function releasing the slots
+    :raises ServiceUnavailable: 503 with a Retry-After header if the connector is overloaded
+    """
+    c = controller(database)
+    if c is None:
+        return lambda: None
+    try:
+        waited = c.acquire(priority, slots)
+    except OverloadedError as e:
+        rejected_counter.add(1, {"db.database": database, "reason": str(e)})
+        _log.warning("rejected %s priority request of %s: %s", priority, database, e)
+        raise ServiceUnavailable("database {} is overloaded, please retry later".format(database), retry_after=c.retry_after()) from e
+    wait_histogram.record(waited, {"db.database": database, "priority": priority})
+    return lambda: c.release(slots)
+
+
+@contextmanager
+def admit(database, priority="normal"):
+    """
+    context manager holding a slot of the given connector, see acquire
+    :raises ServiceUnavailable: 503 with a Retry-After header if the connector is overloaded
+    """
+    release = acquire(database, priority)
+    try:
+        yield
+    finally:
+        release()
+
+
+def init_app(app):
+    """
+    registers an error handler for the given flask app which keeps the Retry-After header of rejected requests
+    """
+    from flask import jsonify
+
+    @app.errorhandler(ServiceUnavailable)
+    def handle_overloaded(e):
+        # same response as the generic handler of visyn_core which drops the headers of the exception
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after is not None else {}
+        return jsonify({"detail": e.description}), 503, headers
+
+
+def stats():
+    """
+    :return: dict of database to the stats of its admission controller
+    """
+    return {database: c.stats() for database, c in list(_controllers.items()) if c is not None}
+
+
+def _observe(key):
+    def callback(options):
+        return [
+            metrics.Observation(c.stats()[key], {"db.database": database}) for database, c in list(_controllers.items()) if c is not None
+        ]
+
+    return callback
+
+
+meter.create_observable_gauge(
+    name="tdp_db_admission_queue_depth", callbacks=[_observe("queued")], description="Number of requests waiting for a connector", unit="1"
+)
+meter.create_observable_gauge(
+    name="tdp_db_admission_active",
+    callbacks=[_observe("active")],
+    description="Number of slots held by the admitted requests of a connector",
+    unit="1",
+)
@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any
+
+_log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    thread safe least recently used cache with an optional time to live per entry and hit/miss counters
+    """
+
+    def __init__(self, max_entries=256, ttl=None):
+        """
+        :param max_entries: maximal number of entries before the least recently used one is evicted
+        :param ttl: optional time to live of an entry in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        returns the cached value for the given key or the default if it is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry  # type: ignore
+                if expires >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # expired
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        stores the given value and evicts the least recently used entries if the cache is full
+        """
+        if self.max_entries <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, keys):
+        """
+        looks up multiple keys at once
+        :return: dict of the keys that are cached and not expired to their value
+        """
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key, _MISSING)
+                if entry is not _MISSING and entry[0] >= now:  # type: ignore
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]  # type: ignore
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items):
+        """
+        stores multiple key value pairs at once
+        :param items: dict or iterable of (key, value) tuples
+        """
+        if self.max_entries <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            for key, value in items.items() if isinstance(items, dict) else items:
+                self._entries[key] = (expires, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        :return: dict with the current size and the hit/miss/eviction counters
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    deduplicates concurrent calls with the same key: the first caller executes the function while callers arriving in the meantime wait
+    for and share its result or exception, i.e. the very same object which must not be modified by the callers
+    """
+
+    def __init__(self):
+        self._calls: dict[Any, Future] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """
+        :param key: hashable key identifying the call
+        :param fn: function without arguments computing the result
+        :return: the result of fn, possibly computed by a concurrent caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.executions += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return call.result()  # another caller executes the function
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+        call.set_result(result)
+        return result
+
+    def __len__(self):
+        return len(self._calls)
+
+    def stats(self):
+        """
+        :return: dict with the number of calls in flight, executions, and calls which shared the result of another one
+        """
+        return {"in_flight": len(self._calls), "executions": self.executions, "shared": self.shared}
+
+
+class CachedRows(list):
+    """
+    rows stored in a result cache, additionally holding serialized versions of them (e.g. compressed response bodies) keyed by format.
+    The rows are returned to every hit and therefore read-only, modifying them would change the result of later requests and the
+    payloads would no longer match.
+    """
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.payloads: dict[Any, Any] = {}
+
+
+def freeze(obj):
+    """
+    converts the given (nested) arguments to a hashable representation, e.g. to be used as cache key
+    :param obj: dict, MultiDict, list, tuple or primitive value
+    :return: hashable version of obj
+    """
+    if hasattr(obj, "lists"):  # MultiDict
+        return tuple(sorted((k, freeze(v)) for k, v in obj.lists()))
+    if isinstance(obj, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    if isinstance(obj, set):
+        return frozenset(freeze(v) for v in obj)
+    return obj
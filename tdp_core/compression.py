@@ -0,0 +1,154 @@
+import logging
+import zlib
+
+from flask import request
+from flask.wrappers import Response
+
+from .settings import get_settings
+
+_log = logging.getLogger(__name__)
+
+_COMPRESSIBLE_MIMETYPES = {"application/json", "application/javascript", "application/vnd.apache.arrow.stream"}
+
+
+def _brotli():
+    try:
+        import brotli  # type: ignore
+    except ImportError:
+        return None
+    return brotli
+
+
+def negotiate_encoding():
+    """
+    selects the content encoding of the current request based on its Accept-Encoding header
+    :return: br, gzip, or None if compression is disabled or not accepted
+    """
+    if not get_settings().compression.enabled:
+        return None
+    accepted = request.accept_encodings
+    if accepted["br"] > 0 and _brotli() is not None:
+        return "br"
+    if accepted["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def _compressor(encoding):
+    """
+    :return: (compress chunk, flush) functions of a streaming compressor for the given encoding
+    """
+    settings = get_settings().compression
+    if encoding == "br":
+        compressor = _brotli().Compressor(quality=settings.brotli_quality)  # type: ignore
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(settings.gzip_level, wbits=31)  # gzip container
+    return compressor.compress, compressor.flush
+
+
+def compress(data: bytes, encoding):
+    """
+    compresses the given data in one go
+    """
+    process, finish = _compressor(encoding)
+    return process(data) + finish()
+
+
+def _iter_compressed(chunks, encoding):
+    process, finish = _compressor(encoding)
+    for chunk in chunks:
+        compressed = process(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+
+def _is_compressible(response):
+    if (
+        response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+    ):
+        return False
+    mimetype = response.mimetype or ""
+    return mimetype.startswith("text/") or mimetype in _COMPRESSIBLE_MIMETYPES
+
+
+def _mark_compressed(response, encoding):
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:  # a strong etag identifies a single representation
+        response.set_etag("{}-{}".format(etag, encoding))
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def compress_response(response):
+    """
+    after request handler compressing large and streamed responses according to the Accept-Encoding of the request
+    """
+    if not _is_compressible(response):
+        return response
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # the size is unknown, chunked responses are large by nature
+        response.response = _iter_compressed(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+        return _mark_compressed(response, encoding)
+
+    data = response.get_data()
+    if len(data) < get_settings().compression.min_size:
+        return response
+    response.set_data(compress(data, encoding))
+    return _mark_compressed(response, encoding)
+
+
+def cached_response(rows, key, create):
+    """
+    creates the response of the given rows. If the rows come from the result cache (see cache.CachedRows), the compressed
+    response body is stored along with them such that later hits neither serialize nor compress the rows again
+    :param rows: the rows to respond
+    :param key: identifies the format of the response
+    :param create: function creating the uncompressed response
+    :return: the response
+    """
+    payloads = getattr(rows, "payloads", None)
+    encoding = negotiate_encoding() if payloads is not None else None
+    if encoding is None:
+        return create()
+
+    payload = payloads.get((key, encoding))
+    if payload is None:
+        response = create()
+        if response.is_streamed or not _is_compressible(response):
+            return response
+        data = response.get_data()
+        if len(data) < get_settings().compression.min_size:
+            return response
+        payload = (compress(data, encoding), response.headers["Content-Type"], len(data))
+        payloads[(key, encoding)] = payload
+    else:
+        _log.debug("serving compressed response from the result cache")
+
+    body, content_type, length = payload
+    response = _mark_compressed(Response(body, content_type=content_type), encoding)
+    response.uncompressed_length = length
+    return response
+
+
+def uncompressed_length(response):
+    """
+    :return: the size of the uncompressed body of the given not streamed response, also for compressed responses of cached_response
+    """
+    return getattr(response, "uncompressed_length", None) or response.calculate_content_length()
+
+
+def init_app(app):
+    """
+    registers the response compression for the given flask app
+    """
+    app.after_request(compress_response)
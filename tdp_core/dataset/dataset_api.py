@@ -4,10 +4,12 @@ from flask import Flask, abort, make_response, request
 from flask.wrappers import Response
 from visyn_core import manager
 
+from .. import compression
 from ..utils import jsonify, to_json
 from .dataset import add, get, iter, list_datasets, remove
 
 app = Flask(__name__)
+compression.init_app(app)
 
 _log = logging.getLogger(__name__)
 
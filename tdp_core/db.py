@@ -1,4 +1,9 @@
+import contextlib
 import logging
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any
 
 from flask import abort
@@ -8,12 +13,21 @@ from sqlalchemy.orm import Session
 from visyn_core import manager
 from werkzeug.datastructures import MultiDict
 
+from . import lookup_index, view_stats
+from .cache import CachedRows, LRUCache, SingleFlight, freeze
+from .dbview import STATEMENT_TIMEOUT_INFO_KEY
+from .settings import get_settings
 from .sql_filter import filter_logic
 from .utils import clean_query, secure_replacements
 
 tracer = trace.get_tracer(__name__)
 _log = logging.getLogger(__name__)
 
+_result_cache: LRUCache | None = None
+_statement_cache: LRUCache | None = None
+_coalescer = SingleFlight()
+_IN_LIST_LIMIT = 1000  # maximal number of elements of an IN list supported by all dialects (Oracle)
+
 
 def _supports_sql_parameters(dialect):
     return dialect.lower() != "sqlite" and dialect.lower() != "oracle"  # sqlite doesn't support array parameters, postgres does
@@ -23,20 +37,19 @@ def _differentiates_empty_string_and_null(dialect):
     return dialect.lower() != "oracle"  # for Oracle, an empty string is the same as a null string
 
 
-def resolve(database):
+def resolve(database, fill_up_columns=True):
     """
     finds and return the connector and engine for the given database
     :param database: database key to lookup
+    :param fill_up_columns: whether to wait until the columns of all views of the connector are derived
     :return: (connector, engine)
     """
     if database not in manager.db.connectors:
         abort(404, 'Database with id "{}" cannot be found'.format(database))
     r = manager.db.connector_and_engine(database)
-    # derive needed columns
-    connector, engine = r
-    for view in connector.views.values():
-        if view.needs_to_fill_up_columns() and view.table is not None:
-            _fill_up_columns(view, engine)
+    if fill_up_columns:
+        # derive needed columns
+        _fill_up_connector_columns(database, *r)
     return r
 
 
@@ -51,15 +64,16 @@ def resolve_engine(database):
     return manager.db.engine(database)
 
 
-def resolve_view(database, view_name, check_default_security=False):
+def resolve_view(database, view_name, check_default_security=False, fill_up_columns=True):
     """
     finds and return the connector, engine, and view for the given database and view_name
     :param database: database key to lookup
     :param view_name: view name to lookup
     :param check_default_security: bool; usually view.can_access returns True when no security is defined on the view. This parameter can be used to tell the method that it should check the security anyway, e.g. that the user is at least logged in
+    :param fill_up_columns: whether to wait until the columns of the view are derived, requests not relying on the column metadata can skip it
     :return: (connector, engine, view)
     """
-    connector, engine = resolve(database)
+    connector, engine = resolve(database, fill_up_columns=False)
     if view_name not in connector.views:
         abort(
             404,
@@ -69,9 +83,53 @@ def resolve_view(database, view_name, check_default_security=False):
     # TODO: improve the logic of the view.can_access function, because even for unauthorized can_access returns True, i.e. that the user can access the resource. Somewhere else the server checks whether the user is authenticated or not
     if not view.can_access(check_default_security):
         abort(403)
+    if fill_up_columns and view.needs_to_fill_up_columns():
+        _derive_columns_in_background(database, view, engine).result()
     return connector, engine, view
 
 
+def _bucket_size(n):
+    """
+    rounds the length of an array parameter up to the next power of two to limit the number of distinct statements
+    """
+    return 1 << (n - 1).bit_length() if n > 0 else 0
+
+
+def _padded_size(n, chunk_size=0):
+    """
+    number of elements an array parameter of length n is padded to: the next power of two, but lists within the IN list limit of
+    Oracle (1000 elements) or within a chunk are never padded beyond that limit
+    """
+    size = _bucket_size(n)
+    for limit in sorted((_IN_LIST_LIMIT, chunk_size)):
+        if n <= limit:
+            return min(size, limit)
+    return size
+
+
+def statement_cache() -> LRUCache:
+    """
+    returns the cache of compiled statements used by to_query, configured via the `tdp_core.db.statement_cache_size` setting
+    """
+    global _statement_cache
+    if _statement_cache is None:
+        _statement_cache = LRUCache(max_entries=get_settings().db.statement_cache_size)
+    return _statement_cache
+
+
+def _compile_query(q, supports_array_parameter, shape):
+    import sqlalchemy
+
+    q = q.replace("\n", " ").replace("\r", " ")
+    # need to suffix all array parameter and wrap with (), only whole names are replaced such that :id doesn't match :ids
+    for k, size in shape:
+        # sounds like an array
+        # convert from :ids to (:ids0, :ids1, :ids2)
+        expanded = "({ids})".format(ids=", ".join(":{}{}".format(k, i) for i in range(size)))
+        q = re.sub(r":{}\b".format(re.escape(k)), expanded, q)
+    return sqlalchemy.sql.text(q)
+
+
 def to_query(q, supports_array_parameter, parameters):
     """
     converts to the native SQL query using sqlalchemy + handling of array parameters
@@ -80,27 +138,94 @@ def to_query(q, supports_array_parameter, parameters):
     :param parameters: dictionary of parameters that are going to be applied
     :return: the transformed query and call by reference updated parameters
     """
-    import sqlalchemy
+    arrays = {} if supports_array_parameter else {k: v for k, v in parameters.items() if isinstance(v, (list, tuple))}
+    # array parameters are padded to power of two buckets such that the statement only depends on the bucket size, see _padded_size
+    chunk_size = get_settings().db.in_list_chunk_size if arrays else 0
+    shape = tuple(sorted((k, _padded_size(len(v), chunk_size)) for k, v in arrays.items()))
+
+    key = (q, supports_array_parameter, shape)
+    parsed = statement_cache().get(key)
+    if parsed is None:
+        parsed = _compile_query(q, supports_array_parameter, shape)
+        statement_cache().set(key, parsed)
+
+    for k, size in shape:
+        v = arrays[k]
+        del parameters[k]  # delete single
+        # add sub, padded with the last value which doesn't change the result of an IN clause
+        parameters.update({(k + str(i)): v[min(i, len(v) - 1)] for i in range(size)})
 
-    q = q.replace("\n", " ").replace("\r", " ")
-    if supports_array_parameter:
-        return sqlalchemy.sql.text(q)
+    return parsed
 
-    # need to suffix all array parameter and wrap with ()
-    for k, v in list(parameters.items()):
-        if not isinstance(v, list) and not isinstance(v, tuple):
-            continue
-        # sounds like an array
-        # convert from :ids to (:ids0, :ids1, :ids2)
-        subparameters = {(k + str(i)): vi for i, vi in enumerate(v)}
-        q = q.replace(
-            ":" + k,
-            "({ids})".format(ids=", ".join(":" + p for p in subparameters)),
-        )
-        del parameters[k]  # delete single
-        parameters.update(subparameters)  # add sub
 
-    return sqlalchemy.sql.text(q)
+class _ChunkedResult:
+    """
+    merged result of a chunked execution, supports the subset of the sqlalchemy result api used within tdp_core
+    """
+
+    def __init__(self, columns, rows):
+        self._columns = columns
+        self._rows = rows
+
+    def keys(self):
+        return self._columns
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def fetchall(self):
+        return self._rows
+
+    all = fetchall
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def scalar(self):
+        return self._rows[0][0] if self._rows else None
+
+
+class _LazyName:
+    """
+    name of a session for debug logs, the uuid is only generated if the name is actually formatted
+    """
+
+    def __init__(self):
+        self._uuid = None
+
+    def __str__(self):
+        if self._uuid is None:
+            import uuid
+
+            self._uuid = uuid.uuid4()
+        return str(self._uuid)
+
+
+class _PoolStatus:
+    """
+    lazily formatted pool status for debug logs
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __str__(self):
+        return self._pool.status()
+
+
+def _session_span(name, engine=None):
+    """
+    starts a span for a WrappedSession operation depending on the `tdp_core.db.instrumentation` level:
+    'off' never creates spans, 'sampled' only creates spans if the current trace is sampled, and 'full' always creates spans
+    :param engine: optional engine whose pool status is added as attribute
+    """
+    level = get_settings().db.instrumentation
+    if level == "off" or (level == "sampled" and not trace.get_current_span().get_span_context().trace_flags.sampled):
+        return contextlib.nullcontext()
+    return tracer.start_as_current_span(name, attributes={"db.pool_status": engine.pool.status()} if engine is not None else None)
 
 
 class WrappedSession:
@@ -109,12 +234,10 @@ class WrappedSession:
         session wrapper of sql alchemy with auto cleanup
         :param engine:
         """
-        with tracer.start_as_current_span("WrappedSession.__init__", attributes={"db.pool_status": engine.pool.status()}):
+        with _session_span("WrappedSession.__init__", engine):
             self._engine = engine
-            import uuid
-
-            self._name = uuid.uuid4()
-            _log.debug("%s - engine status before: %s", self._name, engine.pool.status())
+            self._name = _LazyName()
+            _log.debug("%s - engine status before: %s", self._name, _PoolStatus(engine.pool))
             _log.debug("%s - creating session", self._name)
             # add connection count and session count with SQLALCHEMY_POOL_SIZE and SQLALCHEMY_MAX_OVERFLOW
             # https://stackoverflow.com/questions/34775501/how-could-i-check-the-number-of-active-sqlalchemy-connections-in-a-pool-at-any-g
@@ -122,6 +245,7 @@ class WrappedSession:
             _log.debug("%s - session created", self._name)
             self._supports_array_parameter = _supports_sql_parameters(engine.name)
             _log.debug("%s - supports array parameter: %s", self._name, self._supports_array_parameter)
+            self._statement_timeout = None  # (config, timeout) as applied by ensure_statement_timeout
 
     def execute(self, sql, **kwargs):
         """
@@ -130,18 +254,63 @@ class WrappedSession:
         :param kwargs: additional args to replace
         :return: the session result
         """
-        with tracer.start_as_current_span("WrappedSession.execute", attributes={"db.pool_status": self._engine.pool.status()}):
-            _log.debug("%s - replace array parameter in sql query: %s", self._name, sql)
-            parsed = to_query(sql, self._supports_array_parameter, kwargs)
-            _log.debug("%s - execute the given query with the given args: %s", self._name, sql)
-            _log.debug("%s (%s)", parsed, kwargs)
-            try:
-                return self._session.execute(parsed, kwargs)
-            except OperationalError as error:
-                _log.error("OperationalError: %s", error)
-                abort(408, error)
-            except SQLAlchemyError as error:
-                _log.error("SQLAlchemyError: %s", error)
+        with _session_span("WrappedSession.execute", self._engine):
+            return self._execute(sql, kwargs)
+
+    def _execute(self, sql, kwargs, execution_options=None):
+        _log.debug("%s - replace array parameter in sql query: %s", self._name, sql)
+        parsed = to_query(sql, self._supports_array_parameter, kwargs)
+        _log.debug("%s - execute the given query with the given args: %s", self._name, sql)
+        _log.debug("%s (%s)", parsed, kwargs)
+        try:
+            return self._session.execute(parsed, kwargs, execution_options=execution_options or {})
+        except OperationalError as error:
+            _log.error("OperationalError: %s", error)
+            abort(408, error)
+        except SQLAlchemyError as error:
+            _log.error("SQLAlchemyError: %s", error)
+
+    def execute_chunked(self, sql, **kwargs):
+        """
+        similar to execute but splits the largest list parameter into chunks of `tdp_core.db.in_list_chunk_size` elements if it is longer.
+        The chunks are executed concurrently on pooled connections and the rows are concatenated in the order of the chunks.
+        Only valid for queries whose result is the union of the results of the chunks, i.e. without aggregation, ordering or limits.
+        :param sql: query
+        :param kwargs: additional args to replace
+        :return: the session result
+        """
+        import contextvars
+
+        settings = get_settings().db
+        lists = [(len(v), k) for k, v in kwargs.items() if isinstance(v, (list, tuple))]
+        if not lists or max(lists)[0] <= settings.in_list_chunk_size:
+            return self.execute(sql, **kwargs)
+
+        with _session_span("WrappedSession.execute_chunked", self._engine):
+            _, key = max(lists)
+            values = kwargs[key]
+            size = settings.in_list_chunk_size
+            chunks = [{**kwargs, key: values[i : i + size]} for i in range(0, len(values), size)]
+            _log.debug("%s - execute %s in %d chunks", self._name, key, len(chunks))
+
+            def run_chunk(chunk_kwargs):
+                with session(self._engine) as sess:
+                    if self._statement_timeout:
+                        sess.ensure_statement_timeout(*self._statement_timeout)
+                    result = sess._execute(sql, chunk_kwargs)
+                    return list(result) if result is not None else []
+
+            with ThreadPoolExecutor(max_workers=max(1, min(settings.in_list_max_workers, len(chunks) - 1))) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, run_chunk, c) for c in chunks[1:]]
+                # the first chunk runs on this session
+                first = self._execute(sql, chunks[0])
+                if first is None:
+                    return None
+                columns = list(first.keys())
+                rows = list(first)
+                for future in futures:
+                    rows.extend(future.result())
+            return _ChunkedResult(columns, rows)
 
     def run(self, sql, **kwargs):
         """
@@ -150,48 +319,104 @@ class WrappedSession:
         :param kwargs: args for this query
         :return: list of dicts
         """
-        with tracer.start_as_current_span("WrappedSession.run"):
+        with _session_span("WrappedSession.run"):
             _log.debug("%s - run sql statement: %s", self._name, sql)
             result = self.execute(sql, **kwargs)
             _log.debug("%s - ran sql statement: %s", self._name, sql)
             columns = result.keys()  # type: ignore
             return [{c: r[c] for c in columns} for r in result]  # type: ignore
 
+    def run_chunked(self, sql, **kwargs):
+        """
+        like run but using execute_chunked
+        :param sql: the sql query to execute
+        :param kwargs: args for this query
+        :return: list of dicts
+        """
+        with _session_span("WrappedSession.run_chunked"):
+            result = self.execute_chunked(sql, **kwargs)
+            columns = result.keys()  # type: ignore
+            return [{c: r[c] for c in columns} for r in result]  # type: ignore
+
+    def ensure_statement_timeout(self, config, statement_timeout=None):
+        """
+        applies the given statement timeout (or the default one of the connector) to the connection of this session,
+        the statement is only executed if the timeout differs from the one the pooled connection already has
+        :param config: db connector
+        :param statement_timeout: optional view specific statement timeout
+        """
+        self._statement_timeout = (config, statement_timeout)
+        timeout = statement_timeout or config.statement_timeout
+        if not timeout or not config.statement_timeout_query:
+            return
+        info = self._session.connection().info
+        if info.get(STATEMENT_TIMEOUT_INFO_KEY) == timeout:
+            return
+        _log.debug("%s - set statement_timeout to %s", self._name, timeout)
+        self.execute(config.statement_timeout_query.format(timeout))
+        info[STATEMENT_TIMEOUT_INFO_KEY] = timeout
+
+    def iter_batches(self, sql, batch_size=1000, **kwargs):
+        """
+        runs the given sql statement using a server side cursor (if supported) and yields the result in batches
+        :param sql: the sql query to execute
+        :param batch_size: number of rows per batch
+        :param kwargs: args for this query
+        :return: generator of lists of dicts
+        """
+        with _session_span("WrappedSession.iter_batches"):
+            _log.debug("%s - stream sql statement: %s", self._name, sql)
+            result = self._execute(sql, kwargs, {"stream_results": True})
+            if result is None:
+                return
+            columns = list(result.keys())  # type: ignore
+            while True:
+                rows = result.fetchmany(batch_size)  # type: ignore
+                if not rows:
+                    break
+                yield [{c: r[c] for c in columns} for r in rows]
+            _log.debug("%s - streamed sql statement: %s", self._name, sql)
+
     def __call__(self, sql, **kwargs):
-        with tracer.start_as_current_span("WrappedSession.__call__"):
+        with _session_span("WrappedSession.__call__"):
             return self.run(sql, **kwargs)
 
     def __enter__(self):
-        with tracer.start_as_current_span("WrappedSession.__enter__"):
+        with _session_span("WrappedSession.__enter__"):
             return self
 
     def commit(self):
-        with tracer.start_as_current_span("WrappedSession.commit"):
+        with _session_span("WrappedSession.commit"):
             self._session.commit()
 
     def flush(self):
-        with tracer.start_as_current_span("WrappedSession.flush"):
+        with _session_span("WrappedSession.flush"):
             self._session.flush()
 
     def rollback(self):
-        with tracer.start_as_current_span("WrappedSession.rollback"):
+        with _session_span("WrappedSession.rollback"):
             self._session.rollback()
 
     def _destroy(self):
-        with tracer.start_as_current_span("WrappedSession._destroy", attributes={"db.pool_status": self._engine.pool.status()}):
-            if self._session:
-                _log.debug("%s - removing session", self._name)
-                self._session.close()
-                self._session = None  # type: ignore
-                _log.debug("%s - removed session", self._name)
-                _log.debug("%s - engine status after destroy: %s", self._name, self._engine.pool.status())
+        with _session_span("WrappedSession._destroy", self._engine):
+            self._close()
+
+    def _close(self):
+        if self._session:
+            _log.debug("%s - removing session", self._name)
+            self._session.close()
+            self._session = None  # type: ignore
+            _log.debug("%s - removed session", self._name)
+            _log.debug("%s - engine status after destroy: %s", self._name, _PoolStatus(self._engine.pool))
 
     def __del__(self):
-        with tracer.start_as_current_span("WrappedSession.__del__"):
-            self._destroy()
+        # the finalizer may run during the interpreter shutdown or after the settings are gone, so it doesn't open spans
+        if getattr(self, "_session", None) is None:  # already destroyed by __exit__
+            return
+        self._close()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        with tracer.start_as_current_span("WrappedSession.__exit__"):
+        with _session_span("WrappedSession.__exit__"):
             self._destroy()
 
 
@@ -224,6 +449,8 @@ def get_columns(engine, table_name):
         t = col["type"]
         if isinstance(t, (types.Integer, types.Numeric)):
             r["type"] = "number"
+            if isinstance(t, types.Integer):
+                r["integer"] = True
         elif isinstance(t, types.Enum):
             r["type"] = "categorical"
             r["categories"] = sorted(t.enums, key=lambda s: s.lower())  # type: ignore
@@ -348,6 +575,54 @@ def prepare_arguments(view, config, replacements=None, arguments: dict | None =
     return kwargs, replace
 
 
+def result_cache() -> LRUCache:
+    """
+    returns the shared result cache of get_filtered_data, configured via the `tdp_core.db.result_cache` settings
+    """
+    global _result_cache
+    if _result_cache is None:
+        c = get_settings().db.result_cache
+        _result_cache = LRUCache(max_entries=c.max_entries if c.enabled else 0, ttl=c.ttl)
+    return _result_cache
+
+
+def _is_cacheable(view):
+    """
+    whether the results of the given view can be shared between requests
+    """
+    # views with a security callable may depend on the current user
+    return not view.no_cache and not callable(view.security) and not callable(view.query)
+
+
+def _security_identity(view):
+    """
+    identifies the security context in which the result of the view was computed. Users passing a role or login based check see the same
+    data, the result of a security callable may depend on anything of the user.
+    """
+    if callable(view.security):
+        user = manager.security.current_user
+        return "user", user.id if user else None
+    return "security", view.security
+
+
+def _coalesce(kind, database, view, sql, kwargs, fn):
+    """
+    runs fn unless an identical query of a user with the same security identity is already running, in which case its result is shared
+    :param kind: type of the result, e.g. data or count
+    :return: result of fn
+    """
+    if not get_settings().db.coalesce_queries:
+        return fn()
+    return _coalescer.do((kind, database, sql, freeze(kwargs), _security_identity(view)), fn)
+
+
+def query_coalescer() -> SingleFlight:
+    """
+    returns the single-flight group deduplicating the concurrent queries of get_data and get_count, e.g. to inspect its stats
+    """
+    return _coalescer
+
+
 def get_data(
     database,
     view_name,
@@ -355,6 +630,10 @@ def get_data(
     arguments=None,
     extra_sql_argument=None,
     filters=None,
+    use_cache=False,
+    order_by=None,
+    limit=None,
+    where=None,
 ):
     """
     executes the given view name on the given database with the given arguments
@@ -364,9 +643,108 @@ def get_data(
     :param arguments: dict of arguments
     :param extra_sql_argument: additional unchecked kwargs for the query
     :param filters: the dict of dynamically build filter
-    :return: (r, view) tuple of the resulting rows and the resolved view
+    :param use_cache: whether the result may be served from and stored in the result cache
+    :param order_by: optional ORDER BY clause applied on top of the view query
+    :param limit: optional maximal number of rows applied on top of the view query
+    :param where: optional predicate on the columns of the view query applied on top of it, e.g. of the keyset pagination
+    :return: (r, view) tuple of the resulting rows and the resolved view. The rows are read-only since they are shared with concurrent
+    identical queries (see _coalesce) and the result cache, copy them before modifying them, e.g. [dict(row) for row in r]
     """
     with tracer.start_as_current_span("db.get_data"):
+        config, engine, view, sql, kwargs, cache_key = _prepare_data(
+            database, view_name, replacements, arguments, extra_sql_argument, use_cache, order_by, limit, where
+        )
+
+        if sql is None:
+            with tracer.start_as_current_span("db.get_data with callback"):
+                _log.debug("GET DATA with callback variant")
+                # callback variant
+                return view.query(engine, arguments, filters), view
+
+        if cache_key is not None:
+            r = result_cache().get(cache_key)
+            if r is not None:
+                _log.debug("GET DATA served from result cache: %s/%s", database, view_name)
+                return r, view
+
+        # chunks can only be merged if the result isn't ordered or limited on top of the view
+        chunked = view.chunk_in_lists and not (order_by or where or limit is not None)
+
+        def run():
+            start = time.perf_counter()
+            r = _run_data(config, engine, sql, kwargs, view.statement_timeout, chunked)
+            view_stats.record_query(database, view_name, sql, kwargs, time.perf_counter() - start, len(r))
+            return _store_result(cache_key, r)
+
+        return _coalesce("data", database, view, sql, kwargs, run), view
+
+
+def _prepare_data(
+    database, view_name, replacements, arguments, extra_sql_argument=None, use_cache=False, order_by=None, limit=None, where=None
+):
+    """
+    resolves the view and prepares its data query, see get_data
+    :return: (config, engine, view, sql, kwargs, cache_key), sql is None for callback views and cache_key is None if the result must not be cached
+    """
+    config, engine, view = resolve_view(database, view_name)
+
+    kwargs, replace = prepare_arguments(view, config, replacements, arguments, extra_sql_argument)
+
+    if callable(view.query):
+        return config, engine, view, None, kwargs, None
+
+    sql = view.query.format(**replace)
+    if order_by or where or limit is not None:
+        sql = _paginate(sql, engine.name, kwargs, limit, order_by=order_by, where=where)
+    cache_key = None
+    if use_cache and _is_cacheable(view) and result_cache().max_entries > 0:
+        cache_key = (database, view_name, sql, freeze(kwargs))
+    return config, engine, view, sql, kwargs, cache_key
+
+
+def _store_result(cache_key, r):
+    """
+    stores the given rows in the result cache if they are cacheable
+    :return: the rows to return
+    """
+    if cache_key is not None and len(r) <= get_settings().db.result_cache.max_rows:
+        r = CachedRows(r)
+        result_cache().set(cache_key, r)
+    return r
+
+
+def _run_data(config, engine, sql, kwargs, statement_timeout=None, chunked=False):
+    """
+    runs the already formatted data query of a view within a new session
+    :param chunked: whether large list arguments should be split into chunks, see WrappedSession.execute_chunked
+    :return: list of dicts
+    """
+    with session(engine) as sess:
+        _log.debug("%s - GET DATA with session", sess._name)
+        sess.ensure_statement_timeout(config, statement_timeout)
+        _log.debug("%s - GET DATA before run", sess._name)
+        r = sess.run_chunked(sql, **kwargs) if chunked else sess.run(sql, **kwargs)
+        _log.debug("%s - GET DATA after run", sess._name)
+    return r
+
+
+def stream_data(
+    database,
+    view_name,
+    replacements=None,
+    arguments=None,
+    extra_sql_argument=None,
+    filters=None,
+    batch_size=None,
+    order_by=None,
+):
+    """
+    similar to get_data but instead of loading the whole result the rows are fetched lazily in batches
+    :param batch_size: number of rows per batch, defaults to the `tdp_core.db.stream_batch_size` setting
+    :param order_by: optional ORDER BY clause applied on top of the view query
+    :return: (batches, view) tuple of a generator of row batches (list of dicts) and the resolved view
+    """
+    with tracer.start_as_current_span("db.stream_data"):
         config, engine, view = resolve_view(database, view_name)
 
         kwargs, replace = prepare_arguments(view, config, replacements, arguments, extra_sql_argument)
@@ -374,20 +752,43 @@ def get_data(
         query = view.query
 
         if callable(query):
-            with tracer.start_as_current_span("db.get_data with callback"):
-                _log.debug("GET DATA with callback variant")
-                # callback variant
-                return query(engine, arguments, filters), view
+            # callback variant
+            return iter([query(engine, arguments, filters)]), view
 
-        with session(engine) as sess:
-            _log.debug("%s - GET DATA with session", sess._name)
-            if config.statement_timeout and config.statement_timeout_query:
-                _log.debug("set statement_timeout to {}".format(config.statement_timeout))
-                sess.execute(config.statement_timeout_query.format(config.statement_timeout))
-            _log.debug("%s - GET DATA before run", sess._name)
-            r = sess.run(query.format(**replace), **kwargs)
-            _log.debug("%s - GET DATA after run", sess._name)
-        return r, view
+        batch_size = batch_size or get_settings().db.stream_batch_size
+        sql = query.format(**replace)
+        if order_by:
+            sql = _paginate(sql, engine.name, kwargs, order_by=order_by)
+        batches = _iter_data(config, engine, sql, kwargs, batch_size, view.statement_timeout)
+        return _record_batches(database, view_name, sql, kwargs, batches), view
+
+
+def _iter_data(config, engine, sql, kwargs, batch_size, statement_timeout=None):
+    """
+    generator version of _run_data, the session is kept open until the generator is exhausted or closed
+    """
+    with session(engine) as sess:
+        _log.debug("%s - STREAM DATA with session", sess._name)
+        sess.ensure_statement_timeout(config, statement_timeout)
+        yield from sess.iter_batches(sql, batch_size, **kwargs)
+
+
+def _record_batches(database, view_name, sql, kwargs, batches):
+    """
+    passes the batches through and records the query like get_data once they are exhausted. The query time is the time spent fetching
+    the batches, without the time the consumer spent in between.
+    """
+    duration = 0.0
+    rows = 0
+    while True:
+        start = time.perf_counter()
+        batch = next(batches, None)
+        duration += time.perf_counter() - start
+        if batch is None:
+            break
+        rows += len(batch)
+        yield batch
+    view_stats.record_query(database, view_name, sql, kwargs, duration, rows)
 
 
 def get_query(database, view_name, replacements=None, arguments=None, extra_sql_argument=None):
@@ -405,16 +806,159 @@ def get_query(database, view_name, replacements=None, arguments=None, extra_sql_
 
 
 def get_filtered_data(database, view_name, args):
+    """
+    get_data with the filter, sort and keyset pagination arguments of the request, the resulting rows are read-only, see get_data
+    """
     with tracer.start_as_current_span("db.get_filtered_data"):
         config, _, view = resolve_view(database, view_name)
-        # convert to index lookup
-        # row id start with 1
+        replacements, processed_args, extra_args, where_clause, order_by, where, limit = _filter_arguments(view, args)
+
+        return get_data(
+            database,
+            view_name,
+            replacements,
+            processed_args,
+            extra_args,
+            where_clause,
+            use_cache=True,
+            order_by=order_by,
+            limit=limit,
+            where=where,
+        )
+
+
+def _filter_arguments(view, args):
+    """
+    converts the request arguments to the filter and keyset pagination arguments of get_data
+    :return: (replacements, processed_args, extra_args, where_clause, order_by, where, limit)
+    """
+    # convert to index lookup
+    # row id start with 1
+    try:
+        replacements, processed_args, extra_args, where_clause = filter_logic(view, args)
+    except RuntimeError as error:
+        abort(400, error)
+
+    order_by, where, limit = _keyset_logic(view, args, extra_args)
+    return replacements, processed_args, extra_args, where_clause, order_by, where, limit
+
+
+_keyset_column = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _keyset_sort(args):
+    """
+    :return: (column, descending) of the `_sort` argument, a leading '-' denotes a descending order
+    """
+    sort = args.get("_sort")
+    if not sort:
+        return None, False
+    return sort.lstrip("-"), sort.startswith("-")
+
+
+_KEYSET_ID = "id"  # unique column of the views used as tie-breaker of the keyset order
+
+
+def _keyset_order(view, args):
+    """
+    validates the `_sort` argument and derives the ORDER BY clause. The view id is used as tie-breaker to get a total order
+    and rows without a sort value come last regardless of the direction.
+    :return: (column, descending, order_by) or (None, False, None) if there is no `_sort` argument
+    """
+    column, descending = _keyset_sort(args)
+    if not column:
+        return None, False, None
+    if not _keyset_column.fullmatch(column) or not view.is_valid_filter(column):
+        abort(400, 'invalid sort column "{}"'.format(column))
+    order_by = "CASE WHEN {c} IS NULL THEN 1 ELSE 0 END, {c} {direction}, {id} ASC".format(
+        c=column, direction="DESC" if descending else "ASC", id=_KEYSET_ID
+    )
+    return column, descending, order_by
+
+
+def _keyset_logic(view, args, extra_args):
+    """
+    handles keyset (seek) pagination given by the `_sort`, `_after`, and `_limit` arguments. Instead of skipping rows
+    using an offset, the rows after the last seen key (the sort value and id encoded in the opaque `_after` token) are
+    selected by a predicate on top of the view query, such that the costs are independent of the page depth.
+    :param extra_args: call by reference updated extra arguments of filter_logic
+    :return: (order_by, where, limit) to apply on top of the view query
+    """
+    column, descending, order_by = _keyset_order(view, args)
+    try:
+        limit = int(args["_limit"]) if args.get("_limit") else None
+    except ValueError:
+        abort(400, "invalid _limit argument")
+    token = args.get("_after")
+    if not column or not token:
+        return order_by, None, limit
+
+    value, last_id = decode_keyset_token(token)
+    extra_args["_keyset_id"] = last_id
+    if value is None:  # within the trailing rows without sort value
+        return order_by, "({c} IS NULL AND {id} > :_keyset_id)".format(c=column, id=_KEYSET_ID), limit
+    extra_args["_keyset_after"] = value
+    where = "({c} {op} :_keyset_after OR ({c} = :_keyset_after AND {id} > :_keyset_id) OR {c} IS NULL)".format(
+        c=column, op="<" if descending else ">", id=_KEYSET_ID
+    )
+    return order_by, where, limit
+
+
+def encode_keyset_token(value, id):
+    """
+    encodes the last seen key (sort value and id) of a page as opaque continuation token
+    """
+    import base64
+    import json
+
+    return base64.urlsafe_b64encode(json.dumps([value, id], default=str).encode("utf-8")).decode("ascii")
+
+
+def decode_keyset_token(token):
+    import base64
+    import binascii
+    import json
+
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, binascii.Error, TypeError):
+        abort(400, "invalid _after token")
+    # lists would be expanded to row values by to_query
+    if not all(v is None or isinstance(v, (str, int, float, bool)) for v in (value, id)):
+        abort(400, "invalid _after token")
+    return value, id
+
+
+def next_keyset_token(rows, args):
+    """
+    computes the continuation token to fetch the page following the given rows
+    :return: the token or None if there is no next page
+    """
+    column, _ = _keyset_sort(args)
+    if not column or not args.get("_limit") or not rows or len(rows) < int(args["_limit"]):
+        return None
+    return encode_keyset_token(rows[-1].get(column), rows[-1].get(_KEYSET_ID))
+
+
+def stream_filtered_data(database, view_name, args, batch_size=None):
+    """
+    streaming variant of get_filtered_data, the rows are sorted by `_sort` but keyset pagination (`_limit`, `_after`) isn't supported
+    since the continuation token can't be sent after the rows
+    :return: (batches, view) tuple of a generator of row batches and the resolved view
+    """
+    with tracer.start_as_current_span("db.stream_filtered_data"):
+        config, _, view = resolve_view(database, view_name)
+        if args.get("_limit") or args.get("_after"):
+            abort(400, "_limit and _after are not supported for streamed responses")
         try:
             replacements, processed_args, extra_args, where_clause = filter_logic(view, args)
         except RuntimeError as error:
             abort(400, error)
+        _, _, order_by = _keyset_order(view, args)
 
-        return get_data(database, view_name, replacements, processed_args, extra_args, where_clause)
+        return stream_data(
+            database, view_name, replacements, processed_args, extra_args, where_clause, batch_size=batch_size, order_by=order_by
+        )
 
 
 def get_filtered_query(database, view_name, args):
@@ -441,15 +985,15 @@ def _get_count(database, view_name, args):
 
         kwargs, replace = prepare_arguments(view, config, replacements, processed_args, extra_args)
 
-        if "count" in view.queries:
-            count_query = view.queries["count"]
-        elif view.table:
-            count_query = "SELECT count(d.*) as count FROM {table} d {{joins}} {{where}}".format(table=view.table)
-        else:
-            count_query = None
-            abort(500, "invalid view configuration, missing count query and cannot derive it")
+        return config, engine, view, _count_query(view), processed_args, where_clause, replace, kwargs
+
 
-        return config, engine, count_query, processed_args, where_clause, replace, kwargs
+def _count_query(view):
+    if "count" in view.queries:
+        return view.queries["count"]
+    elif view.table:
+        return "SELECT count(d.*) as count FROM {table} d {{joins}} {{where}}".format(table=view.table)
+    abort(500, "invalid view configuration, missing count query and cannot derive it")
 
 
 def get_count(database, view_name, args):
@@ -463,6 +1007,7 @@ def get_count(database, view_name, args):
         (
             config,
             engine,
+            view,
             count_query,
             processed_args,
             where_clause,
@@ -475,17 +1020,132 @@ def get_count(database, view_name, args):
                 # callback variant
                 return count_query(engine, processed_args, where_clause)
 
-        with session(engine) as sess:
-            _log.debug("%s - GET COUNT with session", sess._name)
-            if config.statement_timeout and config.statement_timeout_query:
-                _log.debug("set statement_timeout to {}".format(config.statement_timeout))
-                sess.execute(config.statement_timeout_query.format(config.statement_timeout))
-            _log.debug("%s - GET COUNT before run", sess._name)
-            r = sess.run(count_query.format(**replace), **kwargs)
-            _log.debug("%s - GET COUNT after run", sess._name)
-        if r:
-            return r[0]["count"]
-        return 0
+        sql = count_query.format(**replace)
+
+        def run():
+            start = time.perf_counter()
+            count = _run_count(config, engine, sql, kwargs, view.statement_timeout)
+            view_stats.record_query(database, view_name, sql, kwargs, time.perf_counter() - start, metric="count_time")
+            return count
+
+        return _coalesce("count", database, view, sql, kwargs, run)
+
+
+def _run_count(config, engine, sql, kwargs, statement_timeout=None):
+    """
+    runs the already formatted count query of a view within a new session
+    :return: the count
+    """
+    with session(engine) as sess:
+        _log.debug("%s - GET COUNT with session", sess._name)
+        sess.ensure_statement_timeout(config, statement_timeout)
+        _log.debug("%s - GET COUNT before run", sess._name)
+        r = sess.run(sql, **kwargs)
+        _log.debug("%s - GET COUNT after run", sess._name)
+    if r:
+        return r[0]["count"]
+    return 0
+
+
+# "no limit" of the dialects which don't support an OFFSET without a LIMIT
+_UNLIMITED = {"sqlite": "-1", "mysql": "18446744073709551615", "mariadb": "18446744073709551615"}
+
+
+def _paginate(sql, dialect, kwargs, limit=None, offset=0, order_by=None, where=None):
+    """
+    wraps the given query to filter and sort it and to only return the rows between offset and offset + limit
+    :param kwargs: call by reference updated query arguments
+    :param where: optional predicate on the columns of the query
+    """
+    r = "SELECT * FROM ({}) p".format(sql)
+    if where:
+        r += " WHERE " + where
+    if order_by:
+        r += " ORDER BY " + order_by
+    if offset:
+        kwargs["_page_offset"] = offset
+    if limit is not None:
+        kwargs["_page_limit"] = limit
+    if dialect.lower() == "oracle":
+        if offset:
+            r += " OFFSET :_page_offset ROWS"
+        if limit is not None:
+            r += " FETCH NEXT :_page_limit ROWS ONLY"
+        return r
+    if limit is not None:
+        r += " LIMIT :_page_limit"
+    elif offset and dialect.lower() in _UNLIMITED:
+        # an OFFSET requires a LIMIT
+        r += " LIMIT " + _UNLIMITED[dialect.lower()]
+    if offset:
+        r += " OFFSET :_page_offset"
+    return r
+
+
+def _run_concurrently(*fns):
+    """
+    runs the given functions concurrently, the first one in the current thread and the others in background threads
+    using a copy of the current context (e.g. the current user)
+    :return: list of results in the order of the given functions
+    """
+    import contextvars
+
+    with ThreadPoolExecutor(max_workers=len(fns) - 1 or 1) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, fn) for fn in fns[1:]]
+        first = fns[0]()
+        return [first, *(f.result() for f in futures)]
+
+
+def get_page(database, view_name, args, limit=None, offset=0):
+    """
+    combination of get_filtered_data and get_count which runs the data and the count query concurrently on two connections
+    :param database: db connector name
+    :param view_name: view name
+    :param args: the request arguments
+    :param limit: optional maximal number of rows to return
+    :param offset: number of rows to skip, requires a `_sort` argument since pages are only stable for a total order
+    :return: (rows, total, view)
+    """
+    with tracer.start_as_current_span("db.get_page"):
+        config, engine, view = resolve_view(database, view_name)
+
+        try:
+            replacements, processed_args, extra_args, where_clause = filter_logic(view, args)
+        except RuntimeError as error:
+            abort(400, error)
+        _, _, order_by = _keyset_order(view, args)
+        if offset and not order_by and not callable(view.query):
+            abort(400, "_offset requires a _sort argument")
+
+        kwargs, replace = prepare_arguments(view, config, replacements, processed_args, extra_args)
+
+        query = view.query
+        count_query = _count_query(view)
+
+        def data():
+            if callable(query):
+                r = query(engine, processed_args, where_clause)
+                return r[offset : (offset + limit) if limit is not None else None]
+            data_kwargs = dict(kwargs)
+            sql = query.format(**replace)
+            if limit is not None or order_by:
+                sql = _paginate(sql, engine.name, data_kwargs, limit, offset, order_by)
+            start = time.perf_counter()
+            r = _run_data(config, engine, sql, data_kwargs, view.statement_timeout)
+            view_stats.record_query(database, view_name, sql, data_kwargs, time.perf_counter() - start, len(r))
+            return r
+
+        def count():
+            if callable(count_query):
+                return count_query(engine, processed_args, where_clause)
+            sql = count_query.format(**replace)
+            start = time.perf_counter()
+            total = _run_count(config, engine, sql, dict(kwargs), view.statement_timeout)
+            view_stats.record_query(database, view_name, sql, kwargs, time.perf_counter() - start, metric="count_time")
+            return total
+
+        rows, total = _run_concurrently(data, count)
+        return rows, total, view
 
 
 def get_count_query(database, view_name, args):
@@ -493,6 +1153,7 @@ def get_count_query(database, view_name, args):
         (
             config,
             engine,
+            view,
             count_query,
             processed_args,
             where_clause,
@@ -506,6 +1167,37 @@ def get_count_query(database, view_name, args):
         return {"query": count_query.format(**replace), "args": kwargs}
 
 
+def _string_type(dialect):
+    dialect = dialect.lower()
+    if dialect == "oracle":
+        return "VARCHAR2(4000)"
+    if dialect == "mysql":
+        return "CHAR"
+    if dialect == "mssql":
+        return "NVARCHAR(MAX)"
+    return "VARCHAR"
+
+
+def _distinct_values_query(table_name, columns, dialect):
+    """
+    creates a single query computing the distinct values of all given columns as UNION ALL of the distinct values of
+    each column tagged with the index of the column. The values are casted to strings and ranked in their native order.
+    :return: query with the result columns col (index of the column), cat, and pos
+    """
+    parts = []
+    for i, col in enumerate(columns):
+        where = "{col} is not NULL".format(col=col)
+        if _differentiates_empty_string_and_null(dialect):
+            where += " AND {col} <> ''".format(col=col)
+        parts.append(
+            "SELECT {i} as col, CAST(d.{col} AS {type}) as cat, DENSE_RANK() OVER (ORDER BY d.{col} ASC) as pos "
+            "FROM (SELECT distinct {col} FROM {table} WHERE {where}) d".format(
+                i=i, col=col, type=_string_type(dialect), table=table_name, where=where
+            )
+        )
+    return " UNION ALL ".join(parts) + " ORDER BY col, pos"
+
+
 def derive_columns(table_name, engine, columns=None):
     """
     helper function to derive the columns of a table
@@ -548,22 +1240,24 @@ def derive_columns(table_name, engine, columns=None):
                     for num_col in number_columns:
                         columns[num_col]["min"] = row[num_col + "_min"]
                         columns[num_col]["max"] = row[num_col + "_max"]
-                for col in categorical_columns:
-                    template = """SELECT distinct {col} as cat FROM {table} WHERE {col} is not NULL"""
-                    if _differentiates_empty_string_and_null(engine.name):
-                        template += """ AND {col} <> ''"""
-                    template += """ ORDER BY {col} ASC"""
-                    _log.debug("%s - DERIVE COLUMNS categorical columns before run: %s, %s", sess._name, table_name, col)
-                    cats = sess.execute(template.format(col=col, table=table_name))
-                    _log.debug("%s - DERIVE COLUMNS categorical columns after run: %s, %s", sess._name, table_name, col)
-                    categories = [str(r["cat"]) for r in cats if r["cat"] is not None]  # type: ignore
-                    if columns[col]["type"] == "set":
-                        separator = getattr(columns[col], "separator", ";")
-                        separated_categories = [category.split(separator) for category in categories]
-                        # flatten array
-                        categories = list({category for sublist in separated_categories for category in sublist})
-                        categories.sort()  # sort list to avoid random order with each run
-                    columns[col]["categories"] = categories
+                batch_size = max(get_settings().db.derive_columns.batch_size, 1)
+                for i in range(0, len(categorical_columns), batch_size):
+                    batch = categorical_columns[i : i + batch_size]
+                    _log.debug("%s - DERIVE COLUMNS categorical columns before run: %s, %s", sess._name, table_name, batch)
+                    cats = sess.execute(_distinct_values_query(table_name, batch, engine.name))
+                    _log.debug("%s - DERIVE COLUMNS categorical columns after run: %s, %s", sess._name, table_name, batch)
+                    categories_of = {col: [] for col in batch}
+                    for r in cats:  # type: ignore
+                        if r["cat"] is not None:
+                            categories_of[batch[r["col"]]].append(str(r["cat"]))
+                    for col, categories in categories_of.items():
+                        if columns[col]["type"] == "set":
+                            separator = getattr(columns[col], "separator", ";")
+                            separated_categories = [category.split(separator) for category in categories]
+                            # flatten array
+                            categories = list({category for sublist in separated_categories for category in sublist})
+                            categories.sort()  # sort list to avoid random order with each run
+                        columns[col]["categories"] = categories
                 _log.debug("%s - DERIVE COLUMNS done", sess._name)
 
         return columns
@@ -577,9 +1271,144 @@ def _fill_up_columns(view, engine):
         view.columns_filled_up = True
 
 
+_derive_executors: dict[str, ThreadPoolExecutor] = {}
+_derive_semaphore: threading.BoundedSemaphore | None = None
+_derive_futures: dict[int, Future] = {}
+_derive_lock = threading.Lock()
+
+
+def _derive_columns_in_background(database, view, engine) -> Future:
+    """
+    derives the columns of the given view using the thread pool of its connector, such that a connector with many views doesn't block
+    the others. The number of concurrent derivations over all connectors is capped by a shared semaphore.
+    Concurrent calls for the same view share a single derivation.
+    :return: future
+    """
+    global _derive_semaphore
+    c = get_settings().db.derive_columns
+    with _derive_lock:
+        future = _derive_futures.get(id(view))
+        if future is not None:
+            return future
+        if _derive_semaphore is None:
+            _derive_semaphore = threading.BoundedSemaphore(c.max_workers)
+        executor = _derive_executors.get(database)
+        if executor is None:
+            executor = _derive_executors[database] = ThreadPoolExecutor(
+                max_workers=c.max_workers_per_connector, thread_name_prefix="derive_columns_{}".format(database)
+            )
+        semaphore = _derive_semaphore
+
+        def run():
+            try:
+                with semaphore:
+                    if view.needs_to_fill_up_columns():
+                        _fill_up_columns(view, engine)
+            finally:
+                # allow a retry in case of an error, on success needs_to_fill_up_columns is False anyway
+                with _derive_lock:
+                    _derive_futures.pop(id(view), None)
+
+        future = executor.submit(run)
+        _derive_futures[id(view)] = future
+        return future
+
+
+def columns_readiness(view):
+    """
+    readiness state of the column metadata of the given view
+    :return: 'ready', 'deriving' (derivation in progress), or 'pending' (derivation not yet started)
+    """
+    if not view.needs_to_fill_up_columns():
+        return "ready"
+    return "deriving" if id(view) in _derive_futures else "pending"
+
+
+def _fill_up_connector_columns(database, connector, engine):
+    futures = [
+        _derive_columns_in_background(database, view, engine) for view in connector.views.values() if view.needs_to_fill_up_columns()
+    ]
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    if errors:
+        raise errors[0]
+
+
+def warm_up():
+    """
+    starts deriving the columns of all views of all connectors in the background, errors are logged instead of raised
+    """
+    if not get_settings().db.derive_columns.warm_up:
+        return
+    with tracer.start_as_current_span("db.warm_up"):
+        futures = []
+        for database in list(manager.db.connectors.keys()):
+            try:
+                connector, engine = manager.db.connector_and_engine(database)
+            except Exception:
+                _log.exception("cannot warm up database %s", database)
+                continue
+            # don't wait for the derivations to not delay the other after_server_started hooks
+            futures.extend(_derive_connector_columns_in_background(database, connector, engine))
+            for name, view in connector.views.items():
+                if view.lookup_index is not None:
+                    lookup_index.warm_up(database, name, view)
+        _log.info("warming up %d views", len(futures))
+
+
+def _derive_connector_columns_in_background(database, connector, engine):
+    """
+    starts deriving the columns of all views of the connector which need it without waiting for them, errors are logged
+    :return: list of futures
+    """
+    futures = []
+    for name, view in connector.views.items():
+        if view.needs_to_fill_up_columns():
+            future = _derive_columns_in_background(database, view, engine)
+            future.add_done_callback(lambda f, name=name: _log_derive_error(database, name, f))
+            futures.append(future)
+    return futures
+
+
+def _log_derive_error(database, name, future):
+    if future.exception() is not None:
+        _log.error("cannot derive columns of view %s/%s: %s", database, name, future.exception())
+
+
+def create_warm_up():
+    """
+    entry point of the after_server_started extension point
+    """
+    return warm_up
+
+
+_data_versions: dict[str, tuple[float, Any]] = {}
+
+
+def data_version(database):
+    """
+    returns the data version token of the given connector, see DBConnector.data_version and DBConnector.data_version_query
+    :return: the token as string or None if the connector has no data version
+    """
+    import time
+
+    config, engine = manager.db.connector_and_engine(database)
+    if config.data_version:
+        return str(config.data_version)
+    if not config.data_version_query:
+        return None
+    entry = _data_versions.get(database)
+    if entry is not None and entry[0] >= time.monotonic():
+        return entry[1]
+    with session(engine) as sess:
+        result = sess.execute(config.data_version_query)
+        version = str(result.scalar()) if result is not None else None  # type: ignore
+    _data_versions[database] = (time.monotonic() + config.data_version_ttl, version)
+    return version
+
+
 def _lookup(database, view_name, query, page, limit, args):
     with tracer.start_as_current_span("db._lookup"):
-        config, engine, view = resolve_view(database, view_name)
+        config, engine, view = resolve_view(database, view_name, fill_up_columns=False)
 
         arguments = MultiDict(args)
         offset = page * limit
@@ -615,12 +1444,37 @@ def lookup(database, view_name, query, page, limit, args):
             # callback variant
             return sql(engine, kwargs, None)
 
+        indexed = _lookup_from_index(database, view_name, view, query, page, limit, args)
+        if indexed is not None:
+            return (*indexed, view)
+
+        start = time.perf_counter()
+        sql = sql.format(**replace)
         with session(engine) as sess:
-            r_items = sess.run(sql.format(**replace), **kwargs)
+            r_items = sess.run(sql, **kwargs)
+        view_stats.record_query(database, view_name, sql, kwargs, time.perf_counter() - start, len(r_items), metric="lookup_time")
+
+        return (*_lookup_more(r_items, limit), view)
+
+
+def _lookup_from_index(database, view_name, view, query, page, limit, args):
+    """
+    :return: (items, more) served from the lookup index of the view or None if the view has no up to date index
+    """
+    if not lookup_index.can_serve(view, query):
+        return None
+    index = lookup_index.get(database, view_name, view, MultiDict(args).get("column"))
+    if index is None:
+        return None
+    return index.search(query, page, limit)
 
-        more = len(r_items) > limit
-        if more:
-            # hit the boundary of more remove the artificial one
-            del r_items[-1]
 
-        return r_items, more, view
+def _lookup_more(r_items, limit):
+    """
+    :return: (items, more) of lookup rows fetched with one additional row to check whether there are more
+    """
+    more = len(r_items) > limit
+    if more:
+        # hit the boundary of more remove the artificial one
+        del r_items[-1]
+    return r_items, more
@@ -15,6 +15,8 @@ from .utils import clean_query
 tracer = trace.get_tracer(__name__)
 _log = logging.getLogger(__name__)
 REGEX_TYPE = type(re.compile(""))
+# key within the info dict of a pooled connection storing the currently applied statement timeout
+STATEMENT_TIMEOUT_INFO_KEY = "tdp_statement_timeout"
 
 
 class ArgumentInfo:
@@ -61,6 +63,10 @@ class DBView:
         self.table = None
         self.security = None
         self.no_cache = False
+        self.statement_timeout = None
+        self.lookup_index = None
+        self.chunk_in_lists = False
+        self.priority = None  # admission priority class, see admission.PRIORITIES, defaults to the one of the route
 
     def needs_to_fill_up_columns(self):
         return self.columns_filled_up is False and self.table is not None
@@ -198,6 +204,9 @@ class DBViewBuilder:
         self.v.valid_replacements = view.valid_replacements.copy()
         self.v.security = view.security
         self.v.no_cache = view.no_cache
+        self.v.statement_timeout = view.statement_timeout
+        self.v.lookup_index = view.lookup_index
+        self.v.chunk_in_lists = view.chunk_in_lists
         return self
 
     def description(self, desc, summary=None):
@@ -405,6 +414,50 @@ class DBViewBuilder:
         self.v.no_cache = True
         return self
 
+    def statement_timeout(self, statement_timeout):
+        """
+        overrides the statement timeout of the connector for this view
+        :param statement_timeout: the timeout as expected by the statement_timeout_query of the connector
+        :return: self
+        """
+        self.v.statement_timeout = statement_timeout
+        return self
+
+    def chunk_in_lists(self):
+        """
+        splits large list arguments (e.g. filter_<col> with thousands of ids) into chunks which are executed concurrently.
+        Only valid if the result of the query is the union of the results of the chunks, i.e. without aggregation, ordering or limits.
+        :return: self
+        """
+        self.v.chunk_in_lists = True
+        return self
+
+    def priority(self, priority):
+        """
+        sets the priority class of the queries of this view when the connector is overloaded, see admission.py
+        :param priority: high, normal or low
+        :return: self
+        """
+        from .admission import PRIORITIES
+
+        if priority not in PRIORITIES:
+            raise ValueError("invalid priority {}, expected one of {}".format(priority, list(PRIORITIES)))
+        self.v.priority = priority
+        return self
+
+    def lookup_index(self, refresh_interval=3600, max_age=None, max_rows=1_000_000):
+        """
+        answers lookups of this view from an in-memory trigram index instead of running the query per request, see lookup_index.py
+        :param refresh_interval: seconds after which the index is rebuilt in the background
+        :param max_age: seconds after which a not yet rebuilt index is stale and lookups fall back to SQL, defaults to twice the refresh interval
+        :param max_rows: tables with more rows are not indexed
+        :return: self
+        """
+        from .lookup_index import LookupIndexOptions
+
+        self.v.lookup_index = LookupIndexOptions(refresh_interval, max_age, max_rows)
+        return self
+
     def build(self):
         """
         builds the query and end this builder
@@ -496,6 +549,7 @@ def add_common_queries(
     call_function=None,
     prefix=None,
     name_column="name",
+    lookup_index=False,
 ):
     """
     create a set of common queries
@@ -507,11 +561,17 @@ def add_common_queries(
     :param call_function: another call function
     :param prefix: optional prefix instead of the table name
     :param name_column: name of the name column used to verify items
+    :param lookup_index: whether the lookup views should be served from an in-memory index, True or a dict of DBViewBuilder.lookup_index arguments
     :return: None
     """
     if prefix is None:
         prefix = table
 
+    def with_lookup_index(builder):
+        if not lookup_index:
+            return builder
+        return builder.lookup_index(**(lookup_index if isinstance(lookup_index, dict) else {}))
+
     queries[prefix + "_items"] = (
         DBViewBuilder("lookup")
         .idtype(idtype)
@@ -527,6 +587,7 @@ def add_common_queries(
         .replace("column", columns)
         .call(call_function)
         .call(limit_offset)
+        .call(with_lookup_index)
         .arg("query")
         .build()
     )
@@ -563,6 +624,7 @@ def add_common_queries(
         )
         .replace("column", columns)
         .call(limit_offset)
+        .call(with_lookup_index)
         .arg("query")
         .build()
     )
@@ -592,11 +654,23 @@ class DBMapping:
     simple mapping based on a query of the form `select from_id as f, to_id as t from mapping_table where f in :ids`
     """
 
-    def __init__(self, from_idtype, to_idtype, query, integer_ids=False):
+    def __init__(self, from_idtype, to_idtype, query, integer_ids=False, preload_query=None, refresh_interval=None, version_query=None):
+        """
+        :param from_idtype: source idtype
+        :param to_idtype: target idtype
+        :param query: mapping query with an :ids argument
+        :param integer_ids: whether the ids have to be converted to integers
+        :param preload_query: optional query of the form `select from_id as f, to_id as t from mapping_table` to load the whole mapping into memory once
+        :param refresh_interval: optional seconds after which a preloaded mapping is refreshed in the background
+        :param version_query: optional query returning a single value that changes whenever the mapping changes, a refresh only reloads the mapping if the version changed
+        """
         self.from_idtype = from_idtype
         self.to_idtype = to_idtype
         self.query = query
         self.integer_ids = integer_ids
+        self.preload_query = preload_query
+        self.refresh_interval = refresh_interval
+        self.version_query = version_query
 
 
 class DBConnector:
@@ -618,6 +692,16 @@ class DBConnector:
             self.mappings = mappings
             self.statement_timeout = None
             self.statement_timeout_query: str | None = None
+            self.search_path: str | None = None
+            self.read_only = False
+            self.connection_init_queries: list[str] = []
+            # optional token identifying the current state of the data (e.g. the date of the last import) used to build ETags of view results,
+            # either given as value or as query returning a single value which is cached for data_version_ttl seconds
+            self.data_version: str | None = None
+            self.data_version_query: str | None = None
+            self.data_version_ttl = 60
+            self.async_dburl: str | None = None  # by default derived from the dburl if an async driver is installed, see sql_async
+            self.admission: dict = {}  # overrides of the admission control settings, see admission.py
             self.description = ""
 
     def dump(self, name):
@@ -641,8 +725,77 @@ class DBConnector:
         engine_options.update(config.get("engine", {}))
         _log.debug("db connector: create engine with options %s", engine_options)
 
+        if not self.search_path:
+            self.search_path = config.get("search_path")
+        if not self.read_only:
+            self.read_only = config.get("read_only", False)
+        if not self.connection_init_queries:
+            self.connection_init_queries = config.get("connection_init_queries", [])
+        if not self.data_version:
+            self.data_version = config.get("data_version")
+        if not self.data_version_query:
+            self.data_version_query = config.get("data_version_query")
+        if not self.async_dburl:
+            self.async_dburl = config.get("async_dburl")
+        if not self.admission:
+            self.admission = config.get("admission", {})
+
         with tracer.start_as_current_span("DBConnector.create_engine"):
-            return sqlalchemy.create_engine(self.dburl, poolclass=poolclass, **engine_options)
+            engine = sqlalchemy.create_engine(self.dburl, poolclass=poolclass, **engine_options)
+
+        self.register_connection_events(engine)
+        return engine
+
+    def register_connection_events(self, engine):
+        """
+        registers the initialization of new pooled connections (see init_queries) for the given engine
+        """
+        dialect = engine.dialect.name
+
+        def on_connect(dbapi_connection, connection_record):
+            self._on_connect(dialect, dbapi_connection, connection_record)
+
+        sqlalchemy.event.listen(engine, "connect", on_connect)
+        sqlalchemy.event.listen(engine, "checkin", self._on_checkin)
+
+    def init_queries(self, dialect) -> list[str]:
+        """
+        statements executed once for every new pooled connection, e.g. to set the statement timeout, the search path, or read-only mode
+        :param dialect: name of the engine dialect
+        :return: list of sql statements
+        """
+        queries = []
+        if self.statement_timeout and self.statement_timeout_query:
+            queries.append(self.statement_timeout_query.format(self.statement_timeout))
+        if dialect == "postgresql":
+            if self.search_path:
+                queries.append("SET search_path TO {}".format(self.search_path))
+            if self.read_only:
+                queries.append("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+        elif dialect == "oracle" and self.search_path:
+            queries.append("ALTER SESSION SET CURRENT_SCHEMA = {}".format(self.search_path))
+        elif self.search_path or self.read_only:
+            _log.warning("db connector: search_path and read_only are not supported for dialect %s", dialect)
+        queries.extend(self.connection_init_queries)
+        return queries
+
+    def _on_connect(self, dialect, dbapi_connection, connection_record):
+        queries = self.init_queries(dialect)
+        if queries:
+            cursor = dbapi_connection.cursor()
+            try:
+                for q in queries:
+                    _log.debug("db connector: init connection with %s", q)
+                    cursor.execute(q)
+            finally:
+                cursor.close()
+            dbapi_connection.commit()
+        connection_record.info[STATEMENT_TIMEOUT_INFO_KEY] = self.statement_timeout if self.statement_timeout_query else None
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        # a view specific statement timeout may be reverted by the rollback on return, therefore the state is unknown
+        if connection_record.info.get(STATEMENT_TIMEOUT_INFO_KEY) != self.statement_timeout:
+            connection_record.info.pop(STATEMENT_TIMEOUT_INFO_KEY, None)
 
     def create_sessionmaker(self, engine) -> sessionmaker:
         with tracer.start_as_current_span("DBConnector.create_sessionmaker"):
@@ -1,37 +1,387 @@
-from flask import jsonify, request
+from flask import abort, jsonify, request
 from flask.wrappers import Response
 
+from .utils import to_json
 
-def _format_csv(array_of_dicts):
+_CSV_DELIMITERS = {"tab": "\t", "comma": ",", "semicolon": ";"}
+
+
+def _csv_options(compress=False):
+    """
+    csv options of the current request: `_delimiter` (tab, comma or semicolon) and `_gzip`
+    """
+    delimiter = _CSV_DELIMITERS.get(request.values.get("_delimiter", "tab"), "\t")
+    compress = compress or request.values.get("_gzip", "").lower() in ("1", "true", "yes")
+    return delimiter, compress
+
+
+def _columns(rows):
+    """
+    :return: union of the keys of the given rows in order of appearance
+    """
+    return list(dict.fromkeys(k for row in rows for k in row))
+
+
+def _iter_csv(batches, delimiter="\t", compress=False, columns=None):
+    """
+    writes the given row batches as csv
+    :param columns: the header, by default derived from the first non-empty batch such that keys first appearing in later batches are dropped
+    :return: generator of str or gzip compressed bytes chunks, one per batch
+    """
+    import csv
     import io
+    import zlib
 
-    try:
-        import pandas as pd  # type: ignore
-    except ImportError as e:
-        raise ImportError("pandas is required to format as csv") from e
+    out = io.StringIO()
+    writer = csv.writer(out, delimiter=delimiter, lineterminator="\n")
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    header_written = False
+    for batch in batches:
+        if not batch:
+            continue
+        if columns is None:
+            columns = _columns(batch)
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows([_csv_value(row.get(c)) for c in columns] for row in batch)
+        chunk = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        if gzip is None:
+            yield chunk
+        else:
+            compressed = gzip.compress(chunk.encode("utf-8"))
+            if compressed:
+                yield compressed
+    if gzip is not None:
+        yield gzip.flush()
 
-    if not array_of_dicts:
-        return Response("", mimetype="text/csv")
 
-    out = io.BytesIO()
-    d = pd.DataFrame.from_records(array_of_dicts)
-    d.to_csv(out, sep="\t", encoding="utf-8", index=False)
-    return Response(out.getvalue(), mimetype="text/csv")
+def _csv_response(batches, compress=False, columns=None):
+    delimiter, compress = _csv_options(compress)
+    if compress:
+        return Response(_iter_csv(batches, delimiter, True, columns), mimetype="application/gzip")
+    return Response(_iter_csv(batches, delimiter, columns=columns), mimetype="text/csv")
+
 
+def _batches(array_of_dicts, batch_size=1000):
+    return (array_of_dicts[i : i + batch_size] for i in range(0, len(array_of_dicts), batch_size))
 
-def _format_json_decimal(obj):
+
+def _format_csv(array_of_dicts, view=None, compress=False):
+    # the header is the union of the keys of all rows
+    return _csv_response(_batches(array_of_dicts), compress, _columns(array_of_dicts))
+
+
+def _format_csv_gz(array_of_dicts, view=None):
+    return _format_csv(array_of_dicts, view, True)
+
+
+def _format_json(obj, view=None):
+    return jsonify(obj)
+
+
+def _format_json_decimal(obj, view=None):
     # The Pandas JSON module has been deprecated and removed. The JSON that is used in _util.py_ of phovea_server does not support double_precision.
     # return jsonify(obj, double_precision=15)
     return jsonify(obj)
 
 
+def _to_columns(array_of_dicts):
+    """
+    converts the list of dicts to a dict of column name to list of values. String columns with many repeated values are
+    dictionary encoded as {"dictionary": [distinct values], "codes": [index within dictionary or null per row]}
+    """
+    if not array_of_dicts:
+        return {}
+    columns = {}
+    n = len(array_of_dicts)
+    for c in _columns(array_of_dicts):
+        values = [row.get(c) for row in array_of_dicts]
+        if all(v is None or isinstance(v, str) for v in values):
+            lookup = {}
+            codes = [None if v is None else lookup.setdefault(v, len(lookup)) for v in values]
+            if 0 < len(lookup) * 2 <= n:  # only worth it if the values repeat
+                columns[c] = {"dictionary": list(lookup.keys()), "codes": codes}
+                continue
+        columns[c] = values
+    return columns
+
+
+def _format_columns(array_of_dicts, view=None):
+    return jsonify(_to_columns(array_of_dicts))
+
+
 def formatter(view_name):
-    if view_name.endswith(".csv"):
+    if view_name.endswith(".csv.gz"):
+        return view_name[:-7], _format_csv_gz
+    elif view_name.endswith(".tsv"):
+        return view_name[:-4], _format_csv
+    elif view_name.endswith(".csv"):
         return view_name[:-4], _format_csv
     elif request.values.get("_format") == "csv":
         return view_name, _format_csv
+    elif view_name.endswith(".columns.json"):
+        return view_name[:-13], _format_columns
+    elif request.values.get("_format") == "columns":
+        return view_name, _format_columns
+    elif view_name.endswith(".arrow"):
+        return view_name[:-6], _format_arrow
+    elif request.values.get("_format") == "arrow":
+        return view_name, _format_arrow
+    elif view_name.endswith(".parquet"):
+        return view_name[:-8], _format_parquet
+    elif request.values.get("_format") == "parquet":
+        return view_name, _format_parquet
     elif view_name.endswith(".json"):
         return view_name[:-5], _format_json_decimal
     elif request.values.get("_format") == "json":
         return view_name, _format_json_decimal
-    return view_name, jsonify
+    return view_name, _format_json
+
+
+def _csv_value(v):
+    if v is None or (isinstance(v, float) and v != v):  # None and NaN are empty cells
+        return ""
+    return v
+
+
+def _stream_csv(batches, view=None):
+    """
+    writes the given row batches as tab separated (see _csv_options) csv. The header is derived from the first batch,
+    keys which only appear in later batches are not written.
+    """
+    return _csv_response(batches)
+
+
+def _stream_csv_gz(batches, view=None):
+    return _csv_response(batches, True)
+
+
+def _stream_json(batches, view=None):
+    """
+    writes the given row batches as a single json array
+    """
+
+    def gen():
+        yield "["
+        first = True
+        for batch in batches:
+            if not batch:
+                continue
+            chunk = to_json(batch)[1:-1]  # strip the surrounding brackets
+            yield chunk if first else "," + chunk
+            first = False
+        yield "]"
+
+    return Response(gen(), mimetype="application/json; charset=utf-8")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa  # type: ignore
+    except ImportError as e:
+        raise ImportError("pyarrow is required to format as arrow or parquet") from e
+    return pa
+
+
+def _described_columns(view):
+    return view.columns if view is not None else {}
+
+
+def _arrow_schema(rows, view=None, final=True):
+    """
+    derives the arrow schema of the given rows using the column types of the view. Numbers are float64 unless the column is declared
+    as integer, unknown columns are inferred from their non-null values.
+    :param final: whether rows are all rows, otherwise None is returned if a column has no non-null value to infer its type from
+    """
+    pa = _import_pyarrow()
+
+    described = _described_columns(view)
+    fields = []
+    for c in _columns(rows):
+        column = described.get(c, {})
+        column_type = column.get("type")
+        if column_type == "number":
+            t = pa.int64() if column.get("integer") else pa.float64()
+        elif column_type == "categorical":
+            t = pa.dictionary(pa.int32(), pa.string())
+        elif column_type in ("string", "set"):
+            t = pa.string()
+        else:
+            t = pa.array([row.get(c) for row in rows], from_pandas=True).type
+            if pa.types.is_null(t):
+                if not final:
+                    return None
+                t = pa.string()
+        fields.append(pa.field(c, t))
+    return pa.schema(fields)
+
+
+def _arrow_array(name, values, t):
+    """
+    converts the values to an array of the given type, values of another type are only converted if it is lossless
+    :raises ValueError: if the values don't match the type, e.g. if the type of a column changes between batches
+    """
+    pa = _import_pyarrow()
+
+    array = pa.array(values, from_pandas=True)
+    if array.type == t:
+        return array
+    if pa.types.is_null(array.type):
+        return pa.nulls(len(values), type=t)
+    numeric = (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)) and (pa.types.is_integer(t) or pa.types.is_floating(t))
+    if not numeric:
+        raise ValueError("column {} has values of type {} which don't match the arrow type {}".format(name, array.type, t))
+    try:
+        return array.cast(t, safe=True)
+    except pa.ArrowInvalid as e:
+        raise ValueError("column {} has values which can't be converted to {} without loss: {}".format(name, t, e)) from e
+
+
+def _arrow_batch(schema, rows, view=None):
+    pa = _import_pyarrow()
+
+    described = _described_columns(view)
+    arrays = []
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        declared = described.get(field.name, {}).get("type") in ("number", "categorical", "string", "set")
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()).dictionary_encode())
+        elif declared and pa.types.is_string(field.type):
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+        elif declared and pa.types.is_floating(field.type):
+            arrays.append(pa.array([None if v is None else float(v) for v in values], type=field.type, from_pandas=True))
+        else:
+            arrays.append(_arrow_array(field.name, values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """
+    file like object collecting the written bytes until they are drained, used to stream the output of the pyarrow writers
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iter_arrow(batches, view=None, parquet=False):
+    """
+    writes the given row batches as arrow ipc stream or parquet file, one record batch (row group) per batch
+    :return: generator of bytes
+    """
+    pa = _import_pyarrow()
+
+    def open_writer(schema):
+        if parquet:
+            import pyarrow.parquet as pq  # type: ignore
+
+            return pq.ParquetWriter(sink, schema)
+        return pa.ipc.new_stream(sink, schema)
+
+    def write(rows):
+        record_batch = _arrow_batch(schema, rows, view)
+        if parquet:
+            writer.write_table(pa.Table.from_batches([record_batch]))
+        else:
+            writer.write_batch(record_batch)
+
+    sink = _ChunkSink()
+    writer = None
+    pending: list = []  # rows buffered until the type of every column is known
+    for batch in batches:
+        if not batch:
+            continue
+        if writer is None:
+            pending.extend(batch)
+            schema = _arrow_schema(pending, view, final=False)
+            if schema is None:
+                continue
+            writer = open_writer(schema)
+            batch, pending = pending, []
+        write(batch)
+        yield sink.drain()
+    if writer is None:
+        schema = _arrow_schema(pending, view)
+        writer = open_writer(schema)
+        if pending:
+            write(pending)
+    writer.close()
+    yield sink.drain()
+
+
+_ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+_PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+
+
+def _format_arrow(array_of_dicts, view=None):
+    _import_pyarrow()  # fail before the response is started
+    return Response(_iter_arrow(_batches(array_of_dicts, 64 * 1024), view), mimetype=_ARROW_MIMETYPE)
+
+
+def _format_parquet(array_of_dicts, view=None):
+    _import_pyarrow()
+    return Response(_iter_arrow(_batches(array_of_dicts, 64 * 1024), view, True), mimetype=_PARQUET_MIMETYPE)
+
+
+def _stream_arrow(batches, view=None):
+    _import_pyarrow()
+    return Response(_iter_arrow(batches, view), mimetype=_ARROW_MIMETYPE)
+
+
+def _stream_parquet(batches, view=None):
+    _import_pyarrow()
+    return Response(_iter_arrow(batches, view, True), mimetype=_PARQUET_MIMETYPE)
+
+
+def stream_formatter(view_name):
+    """
+    similar to formatter but returns a function that writes a generator of row batches as chunked response.
+    The columns format can't be streamed since every column needs all rows.
+    """
+    if view_name.endswith(".columns.json") or request.values.get("_format") == "columns":
+        abort(400, "_stream is not supported by the columns format")
+    if view_name.endswith(".csv.gz"):
+        return view_name[:-7], _stream_csv_gz
+    elif view_name.endswith(".tsv"):
+        return view_name[:-4], _stream_csv
+    elif view_name.endswith(".csv"):
+        return view_name[:-4], _stream_csv
+    elif request.values.get("_format") == "csv":
+        return view_name, _stream_csv
+    elif view_name.endswith(".arrow"):
+        return view_name[:-6], _stream_arrow
+    elif request.values.get("_format") == "arrow":
+        return view_name, _stream_arrow
+    elif view_name.endswith(".parquet"):
+        return view_name[:-8], _stream_parquet
+    elif request.values.get("_format") == "parquet":
+        return view_name, _stream_parquet
+    elif view_name.endswith(".json"):
+        return view_name[:-5], _stream_json
+    return view_name, _stream_json
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from opentelemetry import trace
+from visyn_core import manager
+from werkzeug.datastructures import MultiDict
+
+tracer = trace.get_tracer(__name__)
+_log = logging.getLogger(__name__)
+
+_indices: dict[tuple[str, str, str], "LookupIndex"] = {}
+_building: set[tuple[str, str, str]] = set()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="lookup_index")
+
+
+class LookupIndexOptions:
+    def __init__(self, refresh_interval=3600, max_age=None, max_rows=1_000_000):
+        """
+        :param refresh_interval: seconds after which the index is rebuilt in the background while still serving lookups
+        :param max_age: seconds after which the index is considered stale and lookups fall back to SQL, defaults to twice the refresh interval
+        :param max_rows: maximal number of items to index, larger tables are not indexed
+        """
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age if max_age is not None else 2 * refresh_interval
+        self.max_rows = max_rows
+
+
+class LookupIndex:
+    """
+    in-memory trigram index answering the `LOWER(column) LIKE '%query%'` lookups of the views created by add_common_queries
+    """
+
+    def __init__(self, items):
+        """
+        :param items: list of dicts with at least a text attribute, in the order the lookup should return them
+        """
+        self.items = items
+        self.built = time.monotonic()
+        self._texts = [str(item["text"]).lower() if item["text"] is not None else "" for item in items]
+        trigrams: dict[str, list[int]] = {}
+        for i, text in enumerate(self._texts):
+            for gram in {text[j : j + 3] for j in range(len(text) - 2)}:
+                trigrams.setdefault(gram, []).append(i)
+        self._trigrams = trigrams
+
+    def age(self):
+        return time.monotonic() - self.built
+
+    def _candidates(self, query):
+        if len(query) < 3:
+            return range(len(self._texts))
+        postings = [self._trigrams.get(query[j : j + 3]) for j in range(len(query) - 2)]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        candidates = postings[0]
+        for other in postings[1:]:
+            lookup = set(other)
+            candidates = [i for i in candidates if i in lookup]
+        return candidates
+
+    def search(self, query, page, limit):
+        """
+        :param query: lower case query
+        :param page: zero based page
+        :param limit: page size
+        :return: (items, more) tuple
+        """
+        offset = page * limit
+        matches = []
+        for i in self._candidates(query):
+            if query in self._texts[i]:
+                matches.append(self.items[i])
+                if len(matches) > offset + limit:
+                    break
+        return matches[offset : offset + limit], len(matches) > offset + limit
+
+
+def can_serve(view, query):
+    """
+    whether the lookup of the given view can be answered by an index, i.e. the view only depends on the query and column
+    """
+    if view.lookup_index is None or callable(view.query):
+        return False
+    if "%" in query or "_" in query:  # LIKE wildcards
+        return False
+    return set(view.arguments) <= {"query"} and set(view.replacements) <= {"column", "limit", "offset", "offset2"}
+
+
+def _build(database, view_name, column):
+    from . import db
+
+    key = (database, view_name, column)
+    try:
+        with tracer.start_as_current_span("lookup_index.build", attributes={"db.database": database, "db.view": view_name}):
+            connector, engine = manager.db.connector_and_engine(database)
+            view = connector.views[view_name]
+            max_rows = view.lookup_index.max_rows
+            replacements = {"limit": max_rows + 1, "offset": 0, "offset2": max_rows + 1}
+            arguments = MultiDict({"query": "%", "column": column or ""})
+            kwargs, replace = db.prepare_arguments(view, connector, replacements, arguments)
+            items = db._run_data(connector, engine, view.query.format(**replace), kwargs, view.statement_timeout)
+            if len(items) > max_rows:
+                _log.warning("lookup index of %s/%s has more than %d items, skipping", database, view_name, max_rows)
+                return
+            index = LookupIndex(items)
+            with _lock:
+                _indices[key] = index
+            _log.info("built lookup index of %s/%s (%s) with %d items", database, view_name, column, len(items))
+    except Exception:
+        _log.exception("cannot build lookup index of %s/%s (%s)", database, view_name, column)
+    finally:
+        with _lock:
+            _building.discard(key)
+
+
+def build_in_background(database, view_name, column):
+    """
+    (re)builds the index of the given view and column in the background unless it is already being built
+    """
+    key = (database, view_name, column)
+    with _lock:
+        if key in _building:
+            return
+        _building.add(key)
+    _executor.submit(_build, database, view_name, column)
+
+
+def get(database, view_name, view, column):
+    """
+    returns the index of the given view and column if it is available and not stale. Missing or old indices are (re)built in the background.
+    :return: the index or None
+    """
+    index = _indices.get((database, view_name, column))
+    if index is None or index.age() > view.lookup_index.refresh_interval:
+        build_in_background(database, view_name, column)
+    if index is None or index.age() > view.lookup_index.max_age:
+        return None
+    return index
+
+
+def warm_up(database, view_name, view):
+    """
+    builds the indices of the given view for all valid columns
+    """
+    columns = view.valid_replacements.get("column") if "column" in view.replacements else [None]
+    if not isinstance(columns, list):  # only known columns can be indexed upfront
+        return
+    for column in columns:
+        build_in_background(database, view_name, column)
@@ -1,5 +1,10 @@
 import itertools
 import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
 
 from visyn_core import manager
 
@@ -9,6 +14,45 @@ from .dbview import DBMapping
 _log = logging.getLogger(__name__)
 
 
+class PreloadedMapping:
+    """
+    in-memory version of a mapping table: sorted source ids with offsets into the list of target ids
+    """
+
+    def __init__(self, rows, version=None):
+        """
+        :param rows: iterable of (from id, to id) tuples
+        :param version: optional version of the mapping table
+        """
+        self.version = version
+        self.loaded = time.monotonic()
+        keys = []
+        offsets = array("q")
+        targets = []
+        # stable sort to keep the order of the targets of a source id
+        for f, t in sorted((r for r in rows if r[0] is not None), key=itemgetter(0)):
+            if not keys or keys[-1] != f:
+                keys.append(f)
+                offsets.append(len(targets))
+            targets.append(t)
+        offsets.append(len(targets))
+        self._keys = keys
+        self._offsets = offsets
+        self._targets = targets
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, id):
+        try:
+            i = bisect_left(self._keys, id)
+        except TypeError:  # incompatible id type
+            return []
+        if i < len(self._keys) and self._keys[i] == id:
+            return self._targets[self._offsets[i] : self._offsets[i + 1]]
+        return []
+
+
 class SQLMappingTable:
     def __init__(self, mapping: DBMapping, engine):
         self.from_idtype = mapping.from_idtype
@@ -16,6 +60,12 @@ class SQLMappingTable:
         self._engine = engine
         self._query = mapping.query
         self._integer_ids = mapping.integer_ids
+        self._preload_query = mapping.preload_query
+        self._refresh_interval = mapping.refresh_interval
+        self._version_query = mapping.version_query
+        self._preloaded: PreloadedMapping | None = None
+        self._preload_lock = threading.Lock()
+        self._refreshing = False
         # Enable batch mapping operations by ensuring the correct return order
         self.preserves_order = True
 
@@ -25,8 +75,12 @@ class SQLMappingTable:
         if self._integer_ids:  # convert to integer ids
             ids = [int(i) for i in ids]
 
+        if self._preload_query:
+            preloaded = self.preloaded()
+            return [preloaded.get(id) for id in ids]
+
         with db.session(self._engine) as session:
-            mapped = session.execute(self._query, ids=ids)
+            mapped = session.execute_chunked(self._query, ids=ids)
 
             # handle multi mappings
             data = sorted(mapped, key=lambda x: x["f"])  # type: ignore
@@ -34,6 +88,50 @@ class SQLMappingTable:
             # Return according to the given ids to ensure that we are preserving the order correctly
             return [grouped.get(id, []) for id in ids]
 
+    def _version(self):
+        if not self._version_query:
+            return None
+        with db.session(self._engine) as session:
+            return session.execute(self._version_query).scalar()  # type: ignore
+
+    def _load(self, version=None):
+        with db.session(self._engine) as session:
+            rows = [(r["f"], r["t"]) for r in session.execute(self._preload_query)]  # type: ignore
+        preloaded = PreloadedMapping(rows, version)
+        _log.info("preloaded mapping %s to %s with %d ids", self.from_idtype, self.to_idtype, len(preloaded))
+        return preloaded
+
+    def _refresh(self):
+        try:
+            version = self._version()
+            current = self._preloaded
+            if current is not None and version is not None and version == current.version:
+                current.loaded = time.monotonic()  # unchanged, check again after the next interval
+            else:
+                self._preloaded = self._load(version)
+        except Exception:
+            _log.exception("cannot refresh mapping %s to %s", self.from_idtype, self.to_idtype)
+        finally:
+            self._refreshing = False
+
+    def preloaded(self) -> PreloadedMapping:
+        """
+        returns the in-memory mapping, loading it on first access. Outdated mappings are refreshed in the background while the old one is still used.
+        """
+        preloaded = self._preloaded
+        if preloaded is None:
+            with self._preload_lock:
+                if self._preloaded is None:
+                    self._preloaded = self._load(self._version())
+                return self._preloaded
+        if self._refresh_interval is not None and time.monotonic() - preloaded.loaded > self._refresh_interval:
+            with self._preload_lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh, name="mapping_refresh", daemon=True).start()
+        return preloaded
+
 
 def _discover_mappings():
     for k, connector in manager.db.connectors.items():
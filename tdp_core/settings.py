@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel
 from visyn_core import manager
 
@@ -15,6 +17,70 @@ class MongoSettings(BaseModel):
     db_namedsets: str = "targid"
 
 
+class IdMappingCacheSettings(BaseModel):
+    enabled: bool = True
+    max_entries: int = 100_000  # per pair of idtypes
+    ttl: float = 600  # seconds
+
+
+class CompressionSettings(BaseModel):
+    enabled: bool = True
+    min_size: int = 4096  # smaller responses are sent uncompressed
+    gzip_level: int = 6
+    brotli_quality: int = 5  # only used if brotli is installed
+
+
+class DBResultCacheSettings(BaseModel):
+    enabled: bool = False
+    max_entries: int = 256
+    ttl: float = 60  # seconds
+    max_rows: int = 100_000  # larger results are not cached
+
+
+class DBDeriveColumnsSettings(BaseModel):
+    warm_up: bool = True  # derive the columns of all views in the background after the server started
+    batch_size: int = 20  # number of categorical columns whose distinct values are queried at once
+    max_workers: int = 8
+    max_workers_per_connector: int = 4
+
+
+class DBAsyncSettings(BaseModel):
+    enabled: bool = True  # serve the async version of the db api at /api/tdp/async/db
+    engine: dict = {}  # options of the async engines, e.g. pool_size
+
+
+class DBAdmissionSettings(BaseModel):
+    enabled: bool = True
+    max_concurrent: int = 25  # per connector, should be less than the pool size of the engine (30 by default)
+    max_queue: int = 100  # requests exceeding the queue are rejected with 503
+    queue_timeout: float = 10  # seconds a request waits for a slot before it is rejected with 503
+
+
+class DBStatsSettings(BaseModel):
+    enabled: bool = True  # record per view statistics, see view_stats.py
+    window: int = 1024  # number of recent samples per view and metric used to compute the percentiles
+    slow_queries: int = 20  # number of slowest normalized queries kept
+    slow_query_threshold: float = 5  # seconds, slower queries are logged as warning, 0 to disable
+
+
+class DBSettings(BaseModel):
+    result_cache: DBResultCacheSettings = DBResultCacheSettings()
+    derive_columns: DBDeriveColumnsSettings = DBDeriveColumnsSettings()
+    async_api: DBAsyncSettings = DBAsyncSettings()
+    admission: DBAdmissionSettings = DBAdmissionSettings()
+    stats: DBStatsSettings = DBStatsSettings()
+    stream_batch_size: int = 1000  # rows fetched per batch when streaming view results
+    coalesce_queries: bool = True  # concurrent identical queries of get_data and get_count share a single execution
+    statement_cache_size: int = 512  # number of compiled statements kept by db.to_query
+    in_list_chunk_size: int = 1000  # larger list parameters are split into chunks by WrappedSession.execute_chunked
+    in_list_max_workers: int = 4  # number of chunks executed concurrently
+    batch_max_items: int = 100  # maximal number of queries of a single /_batch request
+    batch_max_workers: int = 16
+    batch_max_workers_per_connector: int = 4
+    # spans of the WrappedSession operations: off, sampled (only if the current trace is sampled), or full
+    instrumentation: Literal["off", "sampled", "full"] = "full"
+
+
 class TDPCoreSettings(BaseModel):
     # tdp_matomo
     matomo: MatomoSettings = MatomoSettings()
@@ -22,6 +88,18 @@ class TDPCoreSettings(BaseModel):
     # phovea_data_mongo
     mongo: MongoSettings = MongoSettings()
 
+    # tdp_core.db
+    db: DBSettings = DBSettings()
+
+    # tdp_core.utils.map_scores
+    id_mapping_cache: IdMappingCacheSettings = IdMappingCacheSettings()
+
+    # responses of the flask apps of tdp_core
+    compression: CompressionSettings = CompressionSettings()
+
+    # tdp_core.utils.to_json: std (json module), orjson, or auto (orjson if installed)
+    json_backend: Literal["std", "orjson", "auto"] = "std"
+
 
 def get_settings() -> TDPCoreSettings:
     return manager.settings.tdp_core  # type: ignore
@@ -1,16 +1,21 @@
 import logging
+import threading
+import time
 from functools import wraps
 
-from flask import Flask, abort, jsonify, request
+from flask import Flask, Response, abort, jsonify, make_response, request
 from visyn_core import manager
 from visyn_core.security import login_required
 
-from . import db
-from .formatter import formatter
-from .utils import map_scores, no_cache
+from . import admission, compression, db, view_stats
+from .formatter import formatter, stream_formatter
+from .settings import get_settings
+from .utils import conditional, etag_matches, id_mapping_cache_stats, map_scores, no_cache, not_modified
 
 _log = logging.getLogger(__name__)
 app = Flask(__name__)
+compression.init_app(app)
+admission.init_app(app)
 
 
 # custom login_required decorator to be able to disable the login for DBViews, i.e. to make them public
@@ -21,7 +26,7 @@ def login_required_for_dbviews(func):
     def decorated_view(*args, **kwargs):
         if kwargs.get("view_name", None) is not None and kwargs.get("database", None) is not None:
             view_name, _ = formatter(kwargs["view_name"])
-            config, _, view = resolve_view(kwargs["database"], view_name)
+            config, _, view = resolve_view(kwargs["database"], view_name, fill_up_columns=False)
             if (
                 isinstance(view.security, bool) and view.security is False
             ):  # if security is disabled for the view just call it without checking the login
@@ -41,7 +46,7 @@ def _view_no_cache(func):
     def decorated_view(*args, **kwargs):
         if kwargs.get("view_name", None) is not None and kwargs.get("database", None) is not None:
             view_name, _ = formatter(kwargs["view_name"])
-            config, _, view = db.resolve_view(kwargs["database"], view_name)
+            config, _, view = db.resolve_view(kwargs["database"], view_name, fill_up_columns=False)
             if view.no_cache:
                 return no_cache(func)(*args, **kwargs)
         return func(*args, **kwargs)
@@ -49,41 +54,172 @@ def _view_no_cache(func):
     return decorated_view
 
 
+def _release_when_done(response, release):
+    """
+    releases the admission slot of a streamed response once its body is exhausted or the response is closed, whichever comes first.
+    Both are needed since not all servers close the response, e.g. the WSGIMiddleware of starlette.
+    """
+    lock = threading.Lock()
+
+    def release_once():
+        if lock.acquire(blocking=False):
+            release()
+
+    chunks = response.response
+
+    def iterate():
+        try:
+            yield from chunks
+        finally:
+            release_once()
+
+    response.response = iterate()
+    response.call_on_close(release_once)
+
+
+def _admitted(priority, slots=1):
+    """
+    runs the function within a slot of the admission controller of the database, using the priority class of the view if it has one.
+    The slot of a streamed response is held until the response is closed, i.e. until its rows are fetched and written.
+    :param priority: default priority class of the route
+    :param slots: number of slots, i.e. the number of connections the route uses concurrently
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def decorated_view(*args, **kwargs):
+            view_name, _ = formatter(kwargs["view_name"])
+            config, _, view = db.resolve_view(kwargs["database"], view_name, fill_up_columns=False)
+            release = admission.acquire(kwargs["database"], view.priority or priority, slots)
+            try:
+                response = func(*args, **kwargs)
+            except BaseException:
+                release()
+                raise
+            if isinstance(response, Response) and response.is_streamed:
+                _release_when_done(response, release)
+            else:
+                release()
+            return response
+
+        return decorated_view
+
+    return decorator
+
+
 @app.route("/")
 @login_required_for_dbviews
 def list_database():
-    return jsonify([v.dump(k) for k, v in manager.db.connectors.items()])
+    return conditional(jsonify([v.dump(k) for k, v in manager.db.connectors.items()]))
 
 
 @app.route("/<database>/")
 @login_required_for_dbviews
 def list_view(database):
-    config_engine = db.resolve(database)
+    """
+    lists the views of the database without waiting for their columns to be derived, `columns_readiness` tells whether the columns of a
+    view are complete (ready), being derived (deriving) or not yet derived (pending)
+    """
+    config_engine = db.resolve(database, fill_up_columns=False)
     if not config_engine:
         return abort(404, "Not Found")
-    return jsonify([v.dump(k) for k, v in config_engine[0].views.items() if v.can_access()])
+    db._derive_connector_columns_in_background(database, *config_engine)
+    views = [{**v.dump(k), "columns_readiness": db.columns_readiness(v)} for k, v in config_engine[0].views.items() if v.can_access()]
+    return conditional(jsonify(views))
 
 
-def _return_query():
+def _flag(key):
     # return true if the key is given and the value doesn't start with 'f' -> no value, true, True, T
-    key = "_return_query"
     if key not in request.values:
         return False
     v = request.values[key]
     return not v or v.lower()[0] != "f"
 
 
+def _return_query():
+    return _flag("_return_query")
+
+
+def _stream():
+    return _flag("_stream")
+
+
+def _record_response(database, view_name, response, start):
+    """
+    records the serialization time and the uncompressed size of the response of a view. Streamed responses are recorded once their body
+    is exhausted, their serialization time is the time spent producing the chunks, which includes fetching the rows of `_stream` responses.
+    """
+    if not response.is_streamed:
+        view_stats.record(
+            database, view_name, serialization_time=time.perf_counter() - start, bytes=compression.uncompressed_length(response)
+        )
+        return
+
+    chunks = response.iter_encoded()
+
+    def iterate():
+        duration = 0.0
+        size = 0
+        while True:
+            chunk_start = time.perf_counter()
+            chunk = next(chunks, None)
+            duration += time.perf_counter() - chunk_start
+            if chunk is None:
+                break
+            size += len(chunk)
+            yield chunk
+        view_stats.record(database, view_name, serialization_time=duration, bytes=size)
+
+    response.response = iterate()
+
+
+def _data_etag(database, view_name):
+    """
+    etag of a view result based on the data version of the connector and the request arguments
+    :param view_name: the requested view name including the format suffix
+    :return: the etag or None if the connector has no data version
+    """
+    import hashlib
+
+    version = db.data_version(database)
+    if version is None:
+        return None
+    key = repr((version, database, view_name, sorted(request.values.lists())))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
 @app.route("/<database>/<view_name>", methods=["GET", "POST"])
 @app.route("/<database>/<view_name>/filter", methods=["GET", "POST"])
 @login_required_for_dbviews
 @_view_no_cache
+@_admitted("normal")
 def get_filtered_data(database, view_name):
     """
-    version of getting data in which the arguments starting with `filter_` are used to build a where clause
+    version of getting data in which the arguments starting with `filter_` are used to build a where clause.
+    If `_stream` is given, the rows are fetched in batches and written as chunked response.
+    Keyset pagination is supported via `_sort` (column, prefixed with '-' for descending), `_limit`, and `_after`,
+    the token for the next page is returned in the `X-Continuation-Token` header.
+    Unless the view is marked as no_cache, responses have a strong ETag (based on the data version of the connector or the response body)
+    and requests with a matching If-None-Match header are answered with 304.
     :param database:
     :param view_name:
     :return:
     """
+    etag = None
+    if not _return_query():
+        _, _, view = db.resolve_view(database, formatter(view_name)[0], fill_up_columns=False)
+        if not view.no_cache:
+            etag = _data_etag(database, view_name)
+            if etag is not None and etag_matches(etag):
+                return not_modified(etag)
+
+    if _stream() and not _return_query():
+        # write the rows in chunks while they are fetched from the database
+        view_name, stream = stream_formatter(view_name)
+        batches, view = db.stream_filtered_data(database, view_name, request.values)
+        response = stream(batches, view=view)
+        _record_response(database, view_name, response, time.perf_counter())
+        return conditional(response, etag) if etag is not None else response
 
     view_name, format = formatter(view_name)
 
@@ -92,12 +228,22 @@ def get_filtered_data(database, view_name):
 
     r, view = db.get_filtered_data(database, view_name, request.values)
 
-    return format(r)
+    # cached results keep their compressed response body
+    start = time.perf_counter()
+    response = compression.cached_response(
+        r, (format.__name__, request.values.get("_delimiter")), lambda: make_response(format(r, view=view))
+    )
+    _record_response(database, view_name, response, start)
+    token = db.next_keyset_token(r, request.values)
+    if token:
+        response.headers["X-Continuation-Token"] = token
+    return response if view.no_cache else conditional(response, etag)
 
 
 @app.route("/<database>/<view_name>/score", methods=["GET", "POST"])
 @login_required_for_dbviews
 @_view_no_cache
+@_admitted("low")
 def get_score_data(database, view_name):
     """
     version of getting data like filter with additional mapping of score entries
@@ -116,12 +262,16 @@ def get_score_data(database, view_name):
 
     mapped_scores = map_scores(r, data_idtype, target_idtype) if data_idtype != target_idtype else r
 
-    return format(mapped_scores)
+    start = time.perf_counter()
+    response = make_response(format(mapped_scores, view=view))
+    _record_response(database, view_name, response, start)
+    return response
 
 
 @app.route("/<database>/<view_name>/count", methods=["GET", "POST"])
 @login_required_for_dbviews
 @_view_no_cache
+@_admitted("normal")
 def get_count_data(database, view_name):
     """
     similar to the /filter clause but returns the count of results instead of the rows itself
@@ -138,18 +288,48 @@ def get_count_data(database, view_name):
     return jsonify(r)
 
 
+@app.route("/<database>/<view_name>/page", methods=["GET", "POST"])
+@login_required_for_dbviews
+@_view_no_cache
+@_admitted("normal", slots=2)  # the data and the count query run concurrently
+def get_page_data(database, view_name):
+    """
+    combination of /filter and /count returning a page of rows along with the total number of rows,
+    the page is defined by the optional `_limit` and `_offset` (default 0) arguments, `_offset` requires a `_sort` order (see /filter)
+    :param database:
+    :param view_name:
+    :return: {rows: [...], total: number}
+    """
+    view_name, _ = formatter(view_name)
+    args = request.values.copy()
+    try:
+        limit = int(args.pop("_limit")) if "_limit" in args else None
+        offset = int(args.pop("_offset", 0))
+    except ValueError as error:
+        return abort(400, "invalid page argument: {}".format(error))
+
+    rows, total, view = db.get_page(database, view_name, args, limit, offset)
+
+    start = time.perf_counter()
+    response = jsonify({"rows": rows, "total": total})
+    _record_response(database, view_name, response, start)
+    return response
+
+
 @app.route("/<database>/<view_name>/desc")
 @login_required_for_dbviews
 @_view_no_cache
 def get_desc(database, view_name):
     view_name, _ = formatter(view_name)
     config, _, view = db.resolve_view(database, view_name)
-    return jsonify(view.dump(view_name))
+    response = jsonify(view.dump(view_name))
+    return response if view.no_cache else conditional(response)
 
 
 @app.route("/<database>/<view_name>/lookup", methods=["GET", "POST"])
 @login_required_for_dbviews
 @_view_no_cache
+@_admitted("high")
 def lookup(database, view_name):
     """
     Does the same job as search, but paginates the result set
@@ -168,6 +348,120 @@ def lookup(database, view_name):
     return jsonify({"items": r_items, "more": more})
 
 
+def _multi_dict(args):
+    from werkzeug.datastructures import MultiDict
+
+    return MultiDict([(k, v) for k, values in (args or {}).items() for v in (values if isinstance(values, list) else [values])])
+
+
+# default priority classes of the batch query types, like the ones of the corresponding routes
+_BATCH_PRIORITIES = {"filter": "normal", "count": "normal", "score": "low", "lookup": "high"}
+
+
+def _batch_query(item):
+    """
+    executes a single query of a batch request in the same way as the corresponding route
+    :param item: {database, view, type: filter (default), count, score, lookup or desc, args}
+    :return: the result
+    """
+    database = item["database"]
+    view_name = item["view"]
+    query_type = item.get("type", "filter")
+    args = _multi_dict(item.get("args"))
+
+    _, _, view = db.resolve_view(database, view_name, fill_up_columns=False)
+    if not (isinstance(view.security, bool) and view.security is False) and not manager.security.current_user:
+        abort(401, "No user in login_required request")
+
+    if query_type == "desc":
+        return db.resolve_view(database, view_name)[2].dump(view_name)
+    if query_type not in _BATCH_PRIORITIES:
+        abort(400, "invalid query type: {}".format(query_type))
+
+    with admission.admit(database, view.priority or _BATCH_PRIORITIES[query_type]):
+        if query_type == "filter":
+            return db.get_filtered_data(database, view_name, args)[0]
+        if query_type == "count":
+            return db.get_count(database, view_name, args)
+        if query_type == "score":
+            r, view = db.get_filtered_data(database, view_name, args)
+            target_idtype = args.get("target", view.idtype)
+            return map_scores(r, view.idtype, target_idtype) if view.idtype != target_idtype else r
+        query = args.get("query", "").lower()
+        page = int(args.get("page", 0))
+        limit = int(args.get("limit", 30))
+        r_items, more, _ = db.lookup(database, view_name, query, page, limit, args)
+        return {"items": r_items, "more": more}
+
+
+@app.route("/_batch", methods=["POST"])
+def batch():
+    """
+    executes multiple queries in a single request, the body is a list of {database, view, type, args} objects (see _batch_query).
+    The queries run concurrently with at most `tdp_core.db.batch_max_workers_per_connector` queries per connector at a time.
+    :return: list of {status, data} or {status, error} objects in the order of the queries
+    """
+    import contextvars
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from werkzeug.exceptions import HTTPException
+
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not all(isinstance(item, dict) and "database" in item and "view" in item for item in items):
+        return abort(400, "expected a list of {database, view, type, args} objects")
+    settings = get_settings().db
+    if len(items) > settings.batch_max_items:
+        return abort(400, "too many queries, at most {} are allowed".format(settings.batch_max_items))
+    if not items:
+        return jsonify([])
+
+    semaphores = {
+        database: threading.Semaphore(settings.batch_max_workers_per_connector) for database in {item["database"] for item in items}
+    }
+
+    def run(item):
+        try:
+            with semaphores[item["database"]]:
+                return {"status": 200, "data": _batch_query(item)}
+        except HTTPException as e:
+            return {"status": e.code, "error": e.description}
+        except Exception as e:
+            _log.exception("error in batch query %s/%s", item["database"], item["view"])
+            return {"status": 500, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.batch_max_workers, len(items)))) as executor:
+        # copy the context to keep the current user
+        futures = [executor.submit(contextvars.copy_context().run, run, item) for item in items]
+        return jsonify([f.result() for f in futures])
+
+
+@app.route("/_stats")
+@no_cache
+def stats():
+    """
+    admin only statistics of the views, e.g. to decide which views to index or cache
+    :return: {views: {database: {view: {metric: {count, p50, p95, p99, max}}}}, slow_queries: [...], admission, coalescing, result_cache,
+        id_mapping_cache: {from -> to: {size, hits, misses, hit_rate, ...}}}
+    """
+    from visyn_core.security import current_user
+
+    if not manager.security.current_user:
+        return abort(401, "No user in login_required request")
+    if not current_user().has_role("admin"):
+        return abort(403, "admin role required")
+    return jsonify(
+        {
+            "views": view_stats.stats(),
+            "slow_queries": view_stats.slow_queries(),
+            "admission": admission.stats(),
+            "coalescing": db.query_coalescer().stats(),
+            "result_cache": db.result_cache().stats(),
+            "id_mapping_cache": id_mapping_cache_stats(),
+        }
+    )
+
+
 def create():
     """
     entry point of this plugin
@@ -0,0 +1,243 @@
+import contextvars
+import importlib.util
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from opentelemetry import trace
+from sqlalchemy.exc import OperationalError
+from starlette.concurrency import run_in_threadpool
+from visyn_core import manager
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException as WerkzeugHTTPException
+
+from . import db, view_stats
+from .dbview import STATEMENT_TIMEOUT_INFO_KEY
+from .settings import get_settings
+from .utils import to_json
+
+_log = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+router = APIRouter(prefix="/api/tdp/async/db", tags=["db"])
+
+# async driver per dialect as supported by sqlalchemy
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite", "mysql": "aiomysql"}
+
+_async_engines: dict = {}
+_async_engines_lock = threading.Lock()
+
+
+def _async_dburl(connector):
+    """
+    :return: the async version of the dburl of the connector or None if there is no async driver installed for its dialect
+    """
+    import sqlalchemy
+
+    if connector.async_dburl:
+        return connector.async_dburl
+    url = sqlalchemy.engine.make_url(connector.dburl)
+    backend = url.get_backend_name()
+    driver = _ASYNC_DRIVERS.get(backend)
+    if driver is None or importlib.util.find_spec(driver) is None:
+        return None
+    return url.set(drivername="{}+{}".format(backend, driver))
+
+
+def async_engine(database):
+    """
+    returns the lazily created async engine of the given connector
+    :return: the engine or None if the connector doesn't support async execution, in which case the synchronous implementation is used
+    """
+    if database in _async_engines:
+        return _async_engines[database]
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    with _async_engines_lock:
+        if database not in _async_engines:
+            connector = manager.db.connectors[database]
+            url = _async_dburl(connector)
+            engine = None
+            if url is not None:
+                engine = create_async_engine(url, **get_settings().db.async_api.engine)
+                connector.register_connection_events(engine.sync_engine)
+            else:
+                _log.info("no async driver for database %s, using the synchronous implementation", database)
+            _async_engines[database] = engine
+    return _async_engines[database]
+
+
+@contextmanager
+def _http_errors():
+    # db uses flask's abort, convert to the fastapi equivalent
+    try:
+        yield
+    except WerkzeugHTTPException as e:
+        raise HTTPException(status_code=e.code or 500, detail=e.description) from e
+
+
+async def _in_threadpool(fn, *args):
+    with _http_errors():
+        # copy the context to keep the current user
+        return await run_in_threadpool(contextvars.copy_context().run, fn, *args)
+
+
+async def _arguments(request: Request):
+    items = list(request.query_params.multi_items())
+    if request.method == "POST":
+        form = await request.form()
+        items.extend(form.multi_items())
+    return MultiDict(items)
+
+
+async def _resolve_view(database, view_name):
+    """
+    resolves the view and checks the login like sql.login_required_for_dbviews, the columns are derived in a background thread if necessary
+    """
+    with _http_errors():
+        config, engine, view = db.resolve_view(database, view_name, fill_up_columns=False)
+    if not (isinstance(view.security, bool) and view.security is False) and not manager.security.current_user:
+        raise HTTPException(status_code=401, detail="No user in login_required request")
+    if view.needs_to_fill_up_columns():
+        await _in_threadpool(db.resolve_view, database, view_name)
+    return config, engine, view
+
+
+async def _ensure_statement_timeout(conn, config, statement_timeout=None):
+    # see WrappedSession.ensure_statement_timeout
+    import sqlalchemy
+
+    timeout = statement_timeout or config.statement_timeout
+    if not timeout or not config.statement_timeout_query:
+        return
+    if conn.info.get(STATEMENT_TIMEOUT_INFO_KEY) == timeout:
+        return
+    await conn.execute(sqlalchemy.text(config.statement_timeout_query.format(timeout)))
+    conn.info[STATEMENT_TIMEOUT_INFO_KEY] = timeout
+
+
+async def _run(database, view_name, config, sql, kwargs, statement_timeout=None, metric="query_time"):
+    """
+    async version of db._run_data, the execution is recorded in the view stats like the synchronous one.
+    In contrast to it, concurrent identical queries aren't coalesced and list parameters aren't chunked, queries which need chunks use
+    the synchronous version instead, see _needs_chunks.
+    :param metric: name of the time metric, see view_stats.record_query
+    :return: list of dicts
+    """
+    engine = async_engine(database)
+    with tracer.start_as_current_span("sql_async.run", attributes={"db.database": database}):
+        start = time.perf_counter()
+        kwargs = dict(kwargs)  # to_query replaces the list parameters
+        # the async drivers can't bind lists to `IN :p` (e.g. asyncpg), they are always expanded to single parameters
+        parsed = db.to_query(sql, False, kwargs)
+        try:
+            async with engine.connect() as conn:
+                await _ensure_statement_timeout(conn, config, statement_timeout)
+                result = await conn.execute(parsed, kwargs)
+                r = [dict(r) for r in result.mappings()]
+        except OperationalError as error:
+            _log.error("OperationalError: %s", error)
+            raise HTTPException(status_code=408, detail=str(error)) from error
+        rows = None if metric == "count_time" else len(r)
+        view_stats.record_query(database, view_name, sql, kwargs, time.perf_counter() - start, rows, metric)
+        return r
+
+
+def _needs_chunks(view, kwargs, order_by, where, limit):
+    """
+    :return: whether the data query has to be split into chunks of list parameters, which is only implemented by the synchronous version
+    """
+    if not view.chunk_in_lists or order_by or where or limit is not None:
+        return False
+    chunk_size = get_settings().db.in_list_chunk_size
+    return any(isinstance(v, (list, tuple)) and len(v) > chunk_size for v in kwargs.values())
+
+
+def _json_response(data, view):
+    response = Response(to_json(data), media_type="application/json")
+    if view.no_cache:
+        response.headers["Cache-Control"] = "private, no-cache, no-store, max-age=0"
+    return response
+
+
+@router.api_route("/{database}/{view_name}", methods=["GET", "POST"])
+@router.api_route("/{database}/{view_name}/filter", methods=["GET", "POST"])
+async def get_filtered_data(database: str, view_name: str, request: Request):
+    """
+    async version of /api/tdp/db/<database>/<view_name>/filter
+    """
+    args = await _arguments(request)
+    config, _, view = await _resolve_view(database, view_name)
+
+    if async_engine(database) is None or callable(view.query):
+        r, view = await _in_threadpool(db.get_filtered_data, database, view_name, args)
+    else:
+        with _http_errors():
+            replacements, processed_args, extra_args, _, order_by, where, limit = db._filter_arguments(view, args)
+            config, _, view, sql, kwargs, cache_key = db._prepare_data(
+                database, view_name, replacements, processed_args, extra_args, True, order_by, limit, where
+            )
+        r = db.result_cache().get(cache_key) if cache_key is not None else None
+        if r is None and _needs_chunks(view, kwargs, order_by, where, limit):
+            r, view = await _in_threadpool(db.get_filtered_data, database, view_name, args)
+        elif r is None:
+            r = db._store_result(cache_key, await _run(database, view_name, config, sql, kwargs, view.statement_timeout))
+
+    response = _json_response(r, view)
+    token = db.next_keyset_token(r, args)
+    if token:
+        response.headers["X-Continuation-Token"] = token
+    return response
+
+
+@router.api_route("/{database}/{view_name}/count", methods=["GET", "POST"])
+async def get_count_data(database: str, view_name: str, request: Request):
+    """
+    async version of /api/tdp/db/<database>/<view_name>/count
+    """
+    args = await _arguments(request)
+    _, _, view = await _resolve_view(database, view_name)
+
+    with _http_errors():
+        config, _, view, count_query, _, _, replace, kwargs = db._get_count(database, view_name, args)
+
+    if async_engine(database) is None or callable(count_query):
+        count = await _in_threadpool(db.get_count, database, view_name, args)
+    else:
+        r = await _run(database, view_name, config, count_query.format(**replace), kwargs, view.statement_timeout, "count_time")
+        count = r[0]["count"] if r else 0
+    return _json_response(count, view)
+
+
+@router.api_route("/{database}/{view_name}/lookup", methods=["GET", "POST"])
+async def lookup(database: str, view_name: str, request: Request):
+    """
+    async version of /api/tdp/db/<database>/<view_name>/lookup
+    """
+    args = await _arguments(request)
+    query = args.get("query", "").lower()
+    page = int(args.get("page", 0))  # zero based
+    limit = int(args.get("limit", 30))
+    config, _, view = await _resolve_view(database, view_name)
+
+    with _http_errors():
+        _, view, sql, replace, kwargs = db._lookup(database, view_name, query, page, limit, args)
+
+    if async_engine(database) is None or callable(sql):
+        r_items, more, view = await _in_threadpool(db.lookup, database, view_name, query, page, limit, args)
+    else:
+        indexed = db._lookup_from_index(database, view_name, view, query, page, limit, args)
+        if indexed is None:
+            indexed = db._lookup_more(
+                await _run(database, view_name, config, sql.format(**replace), kwargs, view.statement_timeout, "lookup_time"), limit
+            )
+        r_items, more = indexed
+    return _json_response({"items": r_items, "more": more}, view)
+
+
+def create():
+    if not get_settings().db.async_api.enabled:
+        return APIRouter()
+    return router
@@ -5,6 +5,7 @@ from flask import Flask, abort, jsonify, request
 from pymongo import MongoClient
 from pymongo.collection import ReturnDocument
 
+from . import compression
 from .settings import get_settings
 from .utils import fix_id, random_id
 
@@ -12,6 +13,7 @@ c = get_settings().mongo
 _log = logging.getLogger(__name__)
 
 app = Flask(__name__)
+compression.init_app(app)
 
 
 @app.route("/namedsets/", methods=["GET", "POST"])  # type: ignore
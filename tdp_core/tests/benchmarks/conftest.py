@@ -0,0 +1,107 @@
+import os
+from pathlib import Path
+from typing import Any, Generator
+
+import pytest
+import sqlalchemy
+from visyn_core import manager
+
+from tdp_core.dbview import DBConnector, DBViewBuilder, add_common_queries, inject_where
+
+# number of rows of the synthetic genes table, e.g. TDP_BENCHMARK_SIZES=1000,100000 to skip the largest one
+SIZES = [int(size) for size in os.environ.get("TDP_BENCHMARK_SIZES", "1000,100000,1000000").split(",")]
+
+BIOTYPES = ["protein_coding", "lncRNA", "miRNA", "snRNA", "pseudogene", "rRNA", "snoRNA", "misc_RNA", "TEC", "IG_gene"]
+CHROMOSOMES = [str(i) for i in range(1, 23)] + ["X", "Y"]
+
+
+def pytest_collection_modifyitems(config, items):
+    """
+    benchmarks only run with --benchmark-only (or --benchmark-enable), e.g. via `make benchmark`
+    """
+    if config.getoption("benchmark_only", default=False) or config.getoption("benchmark_enable", default=False):
+        return
+    skip = pytest.mark.skip(reason="benchmarks only run with --benchmark-only")
+    here = Path(__file__).parent
+    for item in items:
+        if here in item.path.parents:
+            item.add_marker(skip)
+
+
+def _create_synthetic_db(engine, n):
+    with engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text(
+                "CREATE TABLE genes (ensg TEXT PRIMARY KEY, symbol TEXT, chromosome TEXT, strand INTEGER, biotype TEXT, seqregionstart INTEGER, score REAL)"
+            )
+        )
+        insert = sqlalchemy.text("INSERT INTO genes VALUES (:ensg, :symbol, :chromosome, :strand, :biotype, :seqregionstart, :score)")
+        for start in range(0, n, 100_000):
+            conn.execute(
+                insert,
+                [
+                    {
+                        "ensg": f"ENSG{i:011d}",
+                        "symbol": f"GENE{i}",
+                        "chromosome": CHROMOSOMES[i % len(CHROMOSOMES)],
+                        "strand": i % 2,
+                        "biotype": BIOTYPES[i % len(BIOTYPES)],
+                        "seqregionstart": (i * 7919) % 250_000_000,
+                        "score": (i % 1000) / 10,
+                    }
+                    for i in range(start, min(n, start + 100_000))
+                ],
+            )
+
+
+def create_synthetic_connector():
+    views = {
+        "genes": DBViewBuilder()
+        .idtype("Ensembl")
+        .table("genes")
+        .query("SELECT ensg AS id, symbol, chromosome, strand, biotype, seqregionstart, score FROM genes")
+        .derive_columns()
+        .column("chromosome", type="categorical")
+        .column("strand", type="categorical")
+        .column("biotype", type="categorical")
+        .call(inject_where)
+        .query("count", "SELECT count(*) as count FROM genes {joins} {where}")
+        .build(),
+        "genes_score": DBViewBuilder("score")
+        .idtype("Ensembl")
+        .query("SELECT ensg AS id, score FROM genes WHERE biotype = :biotype")
+        .arg("biotype")
+        .call(inject_where)
+        .filters(["chromosome", "strand"])
+        .build(),
+    }
+    add_common_queries(views, "genes", "Ensembl", "ensg AS id", ["symbol", "ensg"], name_column="symbol")
+    return DBConnector(views)
+
+
+@pytest.fixture(scope="session")
+def benchmark_app():
+    from visyn_core.server.visyn_server import create_visyn_server
+
+    return create_visyn_server(workspace_config={"visyn_core": {"enabled_plugins": ["tdp_core", "visyn_core"]}})
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda n: f"{n}rows")
+def synthetic_db(request, benchmark_app, tmp_path_factory) -> Generator[tuple[DBConnector, Any, int], Any, None]:
+    """
+    registers the `benchmark` database with a synthetic genes table of the parametrized number of rows
+    """
+    n = request.param
+    connector = create_synthetic_connector()
+    connector.dburl = "sqlite:///{}".format(tmp_path_factory.mktemp("benchmark") / "genes.db")
+    engine = connector.create_engine({"engine": {"connect_args": {"check_same_thread": False}}})
+    _create_synthetic_db(engine, n)
+
+    manager.db.connectors["benchmark"] = connector
+    manager.db._engines["benchmark"] = engine
+    manager.db._sessionmakers[engine] = connector.create_sessionmaker(engine)
+    yield connector, engine, n
+    del manager.db.connectors["benchmark"]
+    del manager.db._engines["benchmark"]
+    del manager.db._sessionmakers[engine]
+    engine.dispose()
@@ -0,0 +1,107 @@
+"""
+microbenchmarks of the db view hot path using a synthetic sqlite connector, see conftest.py. Run with
+
+    pytest tdp_core/tests/benchmarks --benchmark-only --benchmark-json=benchmark.json
+
+and compare releases with `--benchmark-save=<name>` and `--benchmark-compare`. Argument heavy steps (filter_logic, prepare_arguments,
+to_query) filter by 1% of the ids of the table.
+"""
+
+import pytest
+from visyn_core import manager
+from werkzeug.datastructures import MultiDict
+
+from tdp_core import db, utils
+from tdp_core.sql_filter import filter_logic
+
+pytest.importorskip("pytest_benchmark")
+
+
+def run(benchmark, rows, fn, *args):
+    """
+    runs the benchmark with fewer rounds for large tables and records the table size
+    """
+    benchmark.extra_info["rows"] = rows
+    if rows >= 100_000:
+        return benchmark.pedantic(fn, args=args, rounds=max(3, 1_000_000 // rows), warmup_rounds=1)
+    return benchmark(fn, *args)
+
+
+def _filter_args(rows):
+    ids = [f"ENSG{i:011d}" for i in range(0, rows, 100)]
+    return MultiDict([("filter_chromosome", "1"), ("filter_chromosome", "X"), ("filter_strand", "1"), *(("filter_id", i) for i in ids)])
+
+
+def _data():
+    return db.get_data("benchmark", "genes")[0]
+
+
+class _IdentityMapping:
+    def can_map(self, from_idtype, to_idtype):
+        return True
+
+    def __call__(self, from_idtype, to_idtype, ids):
+        return [[id] for id in ids]
+
+
+def test_filter_logic(benchmark, synthetic_db):
+    connector, _, rows = synthetic_db
+    run(benchmark, rows, filter_logic, connector.views["genes"], _filter_args(rows))
+
+
+def test_prepare_arguments(benchmark, synthetic_db):
+    connector, _, rows = synthetic_db
+    view = connector.views["genes"]
+    replacements, processed_args, extra_args, _ = filter_logic(view, _filter_args(rows))
+    run(benchmark, rows, db.prepare_arguments, view, connector, replacements, processed_args, extra_args)
+
+
+def test_to_query(benchmark, synthetic_db):
+    connector, engine, rows = synthetic_db
+    view = connector.views["genes"]
+    replacements, processed_args, extra_args, _ = filter_logic(view, _filter_args(rows))
+    kwargs, replace = db.prepare_arguments(view, connector, replacements, processed_args, extra_args)
+    sql = view.query.format(**replace)
+    supports_array_parameter = db._supports_sql_parameters(engine.dialect.name)
+    # to_query updates the parameters in place
+    run(benchmark, rows, lambda: db.to_query(sql, supports_array_parameter, dict(kwargs)))
+
+
+def test_get_data(benchmark, synthetic_db):
+    _, _, rows = synthetic_db
+    r = run(benchmark, rows, db.get_data, "benchmark", "genes")
+    assert len(r[0]) == rows
+
+
+def test_get_filtered_data(benchmark, synthetic_db):
+    _, _, rows = synthetic_db
+    run(benchmark, rows, db.get_filtered_data, "benchmark", "genes", MultiDict({"filter_chromosome": ["1", "2"], "filter_strand": "1"}))
+
+
+def test_map_scores(benchmark, synthetic_db, monkeypatch):
+    _, _, rows = synthetic_db
+    monkeypatch.setattr(manager, "id_mapping", _IdentityMapping())
+    scores = [{"id": row["id"], "score": row["score"]} for row in _data()]
+
+    monkeypatch.setattr(utils, "_id_mapping_caches", {})
+
+    def map_scores():
+        utils._id_mapping_caches.clear()  # measure the uncached mapping
+        return utils.map_scores(scores, "Ensembl", "Entrez")
+
+    assert len(run(benchmark, rows, map_scores)) == rows
+
+
+def test_to_json(benchmark, synthetic_db):
+    _, _, rows = synthetic_db
+    run(benchmark, rows, utils.to_json, _data())
+
+
+def test_format_csv(benchmark, synthetic_db):
+    from tdp_core.formatter import _format_csv
+    from tdp_core.sql import app
+
+    connector, _, rows = synthetic_db
+    data = _data()
+    with app.test_request_context():
+        run(benchmark, rows, lambda: _format_csv(data, view=connector.views["genes"]).get_data())
@@ -0,0 +1,44 @@
+"""
+per query overhead of the WrappedSession instrumentation levels (tdp_core.db.instrumentation), see test_benchmark_db.py
+"""
+
+import pytest
+
+from tdp_core import db
+from tdp_core.settings import get_settings
+
+from .conftest import SIZES
+from .test_benchmark_db import run
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.parametrize("instrumentation", ["off", "sampled", "full"])
+def test_get_data_instrumentation(benchmark, synthetic_db, monkeypatch, instrumentation):
+    """
+    overhead for a small query, the size of the table doesn't matter
+    """
+    _, _, rows = synthetic_db
+    if rows != min(SIZES):
+        pytest.skip("only measured for the smallest table")
+    monkeypatch.setattr(get_settings().db, "instrumentation", instrumentation)
+    benchmark.extra_info["instrumentation"] = instrumentation
+    run(benchmark, rows, lambda: db.get_data("benchmark", "genes", limit=10))
+
+
+@pytest.mark.parametrize("instrumentation", ["off", "sampled", "full"])
+def test_session_instrumentation(benchmark, synthetic_db, monkeypatch, instrumentation):
+    """
+    overhead of a session with a single query without the rest of get_data
+    """
+    _, engine, rows = synthetic_db
+    if rows != min(SIZES):
+        pytest.skip("only measured for the smallest table")
+    monkeypatch.setattr(get_settings().db, "instrumentation", instrumentation)
+    benchmark.extra_info["instrumentation"] = instrumentation
+
+    def query():
+        with db.session(engine) as sess:
+            return sess.run("SELECT 1 AS one")
+
+    run(benchmark, rows, query)
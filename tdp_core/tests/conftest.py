@@ -1 +1,2 @@
 from .fixtures.app import *  # NOQA
+from .fixtures.db import *  # NOQA
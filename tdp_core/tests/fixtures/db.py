@@ -0,0 +1,90 @@
+from typing import Any, Generator
+
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+from visyn_core import manager
+
+from tdp_core import admission, lookup_index, sql_async, view_stats
+from tdp_core.dbview import DBConnector, DBMapping, DBViewBuilder, add_common_queries, inject_where
+
+
+def _create_genes_db(engine, n=100):
+    with engine.begin() as conn:
+        conn.execute(
+            sqlalchemy.text("CREATE TABLE genes (ensg TEXT PRIMARY KEY, symbol TEXT, chromosome TEXT, strand INTEGER, score REAL)")
+        )
+        conn.execute(
+            sqlalchemy.text("INSERT INTO genes VALUES (:ensg, :symbol, :chromosome, :strand, :score)"),
+            [
+                {"ensg": f"ENSG{i:05d}", "symbol": f"GENE{i}", "chromosome": str(i % 5 + 1), "strand": i % 2, "score": i / 10}
+                for i in range(n)
+            ],
+        )
+        conn.execute(sqlalchemy.text("CREATE TABLE gene_mapping (ensg TEXT, entrez INTEGER)"))
+        conn.execute(
+            sqlalchemy.text("INSERT INTO gene_mapping VALUES (:ensg, :entrez)"),
+            [{"ensg": f"ENSG{i:05d}", "entrez": i} for i in range(n)],
+        )
+
+
+def create_genes_connector():
+    views = {
+        "genes": DBViewBuilder()
+        .idtype("Ensembl")
+        .table("genes")
+        .query("SELECT ensg AS id, symbol, chromosome, strand, score FROM genes")
+        .derive_columns()
+        .column("chromosome", type="categorical")
+        .column("strand", type="categorical")
+        .call(inject_where)
+        .query("count", "SELECT count(*) as count FROM genes {joins} {where}")
+        .build(),
+        "genes_no_cache": DBViewBuilder()
+        .idtype("Ensembl")
+        .query("SELECT ensg AS id, symbol FROM genes")
+        .call(inject_where)
+        .filters(["symbol"])
+        .no_cache()
+        .build(),
+    }
+    add_common_queries(views, "genes", "Ensembl", "ensg AS id", ["symbol", "ensg"], name_column="symbol", lookup_index=True)
+    mappings = [DBMapping("Ensembl", "Entrez", "SELECT ensg AS f, entrez AS t FROM gene_mapping WHERE ensg IN :ids")]
+    return DBConnector(views, mappings=mappings)
+
+
+@pytest.fixture()
+def genes_db(app, tmp_path) -> Generator[tuple[DBConnector, Any], Any, None]:
+    """
+    registers a sqlite based connector with a gene table as `test_genes` database
+    """
+    connector = create_genes_connector()
+    connector.dburl = "sqlite:///{}".format(tmp_path / "genes.db")
+    engine = connector.create_engine({"engine": {"connect_args": {"check_same_thread": False}}})
+    _create_genes_db(engine)
+
+    manager.db.connectors["test_genes"] = connector
+    manager.db._engines["test_genes"] = engine
+    manager.db._sessionmakers[engine] = connector.create_sessionmaker(engine)
+    yield connector, engine
+    del manager.db.connectors["test_genes"]
+    del manager.db._engines["test_genes"]
+    del manager.db._sessionmakers[engine]
+    lookup_index._indices.clear()
+    sql_async._async_engines.pop("test_genes", None)
+    admission._controllers.pop("test_genes", None)
+    view_stats.clear()
+    engine.dispose()
+
+
+@pytest.fixture()
+def db_client(client, genes_db) -> Generator[TestClient, Any, None]:
+    """
+    test client for the /api/tdp/db namespace using the `test_genes` database
+    """
+    from tdp_core import sql
+
+    client.auth = ("admin", "admin")
+    yield client
+    # the legacy flask app is shared between tests, allow it to be initialized again by the next server
+    sql.app._got_first_request = False
@@ -1,3 +1,5 @@
+import pytest
+
 from tdp_core.utils import to_json
 
 
@@ -21,3 +23,27 @@ def test_nan_values(app):
     assert (
         test_result_list_nested == '{"myNum": [13, 5, 7, 12, {"first": [4, 6, 2, null], "second": 3, "third": [null, 3, 78, 6, 3, 2]}, 22]}'
     )
+
+
+@pytest.mark.parametrize("backend", ["std", "orjson"])
+def test_json_backends(app, monkeypatch, backend):
+    import datetime as dt
+    import decimal
+    import json
+
+    from tdp_core import utils
+    from tdp_core.settings import get_settings
+
+    if backend == "orjson":
+        pytest.importorskip("orjson")
+    monkeypatch.setattr(get_settings(), "json_backend", backend)
+    monkeypatch.setattr(utils, "_orjson_dumps", None)
+
+    obj = {
+        "a": [1, float("nan"), {"b": float("nan")}],
+        "c": decimal.Decimal("1.5"),
+        "d": {3},
+        "e": "ä",
+        "f": dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc),
+    }
+    assert json.loads(to_json(obj)) == {"a": [1, None, {"b": None}], "c": 1.5, "d": [3], "e": "ä", "f": 1577836800000}
@@ -0,0 +1,282 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from tdp_core import db
+from tdp_core.cache import LRUCache
+from tdp_core.settings import get_settings
+
+
+@pytest.fixture()
+def result_cache(monkeypatch):
+    monkeypatch.setattr(get_settings().db.result_cache, "enabled", True)
+    monkeypatch.setattr(db, "_result_cache", None)
+    yield db.result_cache()
+    monkeypatch.setattr(db, "_result_cache", None)
+
+
+def test_get_filtered_data(genes_db):
+    r, view = db.get_filtered_data("test_genes", "genes", MultiDict({"filter_chromosome": "1"}))
+    assert len(r) == 20
+    assert {row["chromosome"] for row in r} == {"1"}
+    assert view.columns["chromosome"]["categories"] == ["1", "2", "3", "4", "5"]
+    assert view.columns["strand"]["categories"] == ["0", "1"]
+    assert view.columns["score"]["max"] == 9.9
+
+
+def test_result_cache(genes_db, result_cache):
+    args = MultiDict([("filter_chromosome", "2"), ("filter_chromosome", "3")])
+    r1, _ = db.get_filtered_data("test_genes", "genes", args)
+    r2, _ = db.get_filtered_data("test_genes", "genes", args)
+    assert r1 is r2
+    assert result_cache.stats()["hits"] == 1
+    assert result_cache.stats()["misses"] == 1
+
+    # no_cache views are never cached
+    db.get_filtered_data("test_genes", "genes_no_cache", MultiDict({"filter_symbol": "GENE1"}))
+    db.get_filtered_data("test_genes", "genes_no_cache", MultiDict({"filter_symbol": "GENE1"}))
+    assert len(result_cache) == 1
+
+
+def test_lru_cache_eviction():
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts b
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    expired = LRUCache(max_entries=2, ttl=-1)
+    expired.set("a", 1)
+    assert expired.get("a") is None
+
+
+def test_stream_filtered_data(genes_db):
+    batches, _ = db.stream_filtered_data("test_genes", "genes", MultiDict({"filter_chromosome": "1"}), batch_size=8)
+    batches = list(batches)
+    assert [len(b) for b in batches] == [8, 8, 4]
+    r, _ = db.get_filtered_data("test_genes", "genes", MultiDict({"filter_chromosome": "1"}))
+    assert [row for b in batches for row in b] == r
+
+
+def test_to_query_array_buckets(app):
+    params = {"ids": ("a", "b", "c"), "x": 1}
+    q1 = db.to_query("SELECT * FROM t WHERE id IN :ids AND x = :x", False, params)
+    assert str(q1) == "SELECT * FROM t WHERE id IN (:ids0, :ids1, :ids2, :ids3) AND x = :x"
+    assert params == {"x": 1, "ids0": "a", "ids1": "b", "ids2": "c", "ids3": "c"}
+
+    # same bucket reuses the compiled statement
+    q2 = db.to_query("SELECT * FROM t WHERE id IN :ids AND x = :x", False, {"ids": ("a", "b", "c", "d"), "x": 2})
+    assert q1 is q2
+
+    # parameters whose name is the prefix of another one
+    params = {"id": ("a", "b"), "ids": ("c", "d", "e")}
+    q = db.to_query("SELECT * FROM t WHERE x IN :id AND y IN :ids", False, params)
+    assert str(q) == "SELECT * FROM t WHERE x IN (:id0, :id1) AND y IN (:ids0, :ids1, :ids2, :ids3)"
+    assert params == {"id0": "a", "id1": "b", "ids0": "c", "ids1": "d", "ids2": "e", "ids3": "e"}
+
+    # lists within the IN list limit of Oracle are not padded beyond it
+    assert db._padded_size(600) == 1000
+    assert db._padded_size(600, chunk_size=5000) == 1000
+    assert db._padded_size(1500, chunk_size=5000) == 2048
+    assert db._padded_size(6000, chunk_size=5000) == 8192
+
+
+def test_fill_up_columns_single_flight(genes_db, monkeypatch):
+    connector, _ = genes_db
+    view = connector.views["genes"]
+    calls = []
+    fill_up = db._fill_up_columns
+    monkeypatch.setattr(db, "_fill_up_columns", lambda v, e: calls.append(v) or fill_up(v, e))
+
+    # lookups don't need the column metadata
+    db.resolve_view("test_genes", "genes", fill_up_columns=False)
+    assert db.columns_readiness(view) == "pending"
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: db.resolve_view("test_genes", "genes"), range(8)))
+    assert calls == [view]
+    assert db.columns_readiness(view) == "ready"
+
+
+def test_warm_up_in_background(genes_db, monkeypatch):
+    import threading
+
+    connector, _ = genes_db
+    view = connector.views["genes"]
+    release = threading.Event()
+    fill_up = db._fill_up_columns
+    monkeypatch.setattr(db, "_fill_up_columns", lambda v, e: release.wait(5) and fill_up(v, e))
+
+    db.warm_up()  # returns without waiting for the derivations
+    assert db.columns_readiness(view) == "deriving"
+    assert "test_genes" in db._derive_executors  # every connector has its own workers
+    release.set()
+    db.resolve_view("test_genes", "genes")
+    assert db.columns_readiness(view) == "ready"
+
+
+def test_session_finalizer(genes_db, monkeypatch):
+    _, engine = genes_db
+    with db.session(engine) as exited:
+        exited.run("SELECT 1 AS one")
+    sess = db.session(engine)
+    # the finalizer neither needs the settings nor opens spans
+    monkeypatch.setattr(db, "get_settings", None)
+    exited.__del__()
+    sess.__del__()  # closes a session which wasn't exited
+    assert sess._session is None
+
+
+def test_instrumentation_levels(genes_db, monkeypatch):
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    _, engine = genes_db
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer(__name__)
+    monkeypatch.setattr(db, "tracer", tracer)
+
+    def session_spans(level, parent=False):
+        monkeypatch.setattr(get_settings().db, "instrumentation", level)
+        exporter.clear()
+        if parent:
+            with tracer.start_as_current_span("request"), db.session(engine) as sess:
+                sess.run("SELECT count(*) as count FROM genes")
+        else:
+            with db.session(engine) as sess:
+                sess.run("SELECT count(*) as count FROM genes")
+        return [span.name for span in exporter.get_finished_spans() if span.name.startswith("WrappedSession")]
+
+    assert "WrappedSession.run" in session_spans("full")
+    assert session_spans("off") == []
+    assert session_spans("off", parent=True) == []
+    assert session_spans("sampled") == []  # no sampled trace
+    assert "WrappedSession.run" in session_spans("sampled", parent=True)
+
+
+def test_statement_timeout_per_connection(genes_db, monkeypatch):
+    connector, engine = genes_db
+    monkeypatch.setattr(connector, "statement_timeout", 1000)
+    monkeypatch.setattr(connector, "statement_timeout_query", "PRAGMA busy_timeout = {}")
+    engine.dispose()  # new connection applying the init queries
+
+    executed = []
+    execute = db.WrappedSession.execute
+    monkeypatch.setattr(db.WrappedSession, "execute", lambda self, sql, **kwargs: executed.append(sql) or execute(self, sql, **kwargs))
+
+    db.get_filtered_data("test_genes", "genes", MultiDict())
+    db.get_filtered_data("test_genes", "genes", MultiDict())
+    assert not any(sql.startswith("PRAGMA") for sql in executed)
+
+    # view specific timeouts are only applied if they differ
+    monkeypatch.setattr(connector.views["genes"], "statement_timeout", 2000)
+    db.get_filtered_data("test_genes", "genes", MultiDict())
+    assert "PRAGMA busy_timeout = 2000" in executed
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 2000
+
+
+def test_lookup_index(genes_db, monkeypatch):
+    from tdp_core import lookup_index
+
+    queries = [("gene1", 0), ("gene1", 2), ("ne9", 0), ("e", 3), ("xyz", 0)]
+    with monkeypatch.context() as m:
+        m.setattr(lookup_index, "build_in_background", lambda *args: None)
+        # without an index lookups are answered by SQL
+        expected = [db.lookup("test_genes", "genes_items", q, page, 5, MultiDict({"column": "symbol"}))[:2] for q, page in queries]
+
+    lookup_index._build("test_genes", "genes_items", "symbol")
+    monkeypatch.setattr(db, "session", None)  # the index must not hit the database
+    for (q, page), items in zip(queries, expected, strict=True):
+        assert db.lookup("test_genes", "genes_items", q, page, 5, MultiDict({"column": "symbol"}))[:2] == items
+
+    # wildcards are not supported by the index
+    assert not lookup_index.can_serve(genes_db[0].views["genes_items"], "gene_1")
+
+
+def test_preloaded_mapping_table(genes_db, monkeypatch):
+    from tdp_core.dbview import DBMapping
+    from tdp_core.mapping_table import SQLMappingTable
+
+    connector, engine = genes_db
+    sql_mapping = SQLMappingTable(connector.mappings[0], engine)
+    preloaded_mapping = SQLMappingTable(
+        DBMapping("Ensembl", "Entrez", connector.mappings[0].query, preload_query="SELECT ensg AS f, entrez AS t FROM gene_mapping"),
+        engine,
+    )
+    ids = ["ENSG00003", "ENSG00001", "unknown", "ENSG00099"]
+    assert preloaded_mapping(ids) == sql_mapping(ids) == [[3], [1], [], [99]]
+
+    # once loaded no further queries are needed
+    monkeypatch.setattr(db, "session", None)
+    assert preloaded_mapping(["ENSG00042"]) == [[42]]
+
+
+def test_chunked_in_lists(genes_db, monkeypatch):
+    from tdp_core.mapping_table import SQLMappingTable
+
+    connector, engine = genes_db
+    mapping = SQLMappingTable(connector.mappings[0], engine)
+    ids = [f"ENSG{i:05d}" for i in range(50, 10, -1)]
+    expected = mapping(ids)
+
+    monkeypatch.setattr(get_settings().db, "in_list_chunk_size", 6)
+    # padding never exceeds the chunk size
+    params = {"ids": ("a", "b", "c", "d", "e")}
+    assert str(db.to_query("SELECT * FROM t WHERE id IN :ids", False, params)).count(":ids") == 6
+
+    assert mapping(ids) == expected == [[i] for i in range(50, 10, -1)]
+    with db.session(engine) as sess:
+        assert len(sess.run_chunked("SELECT * FROM genes WHERE ensg IN :ids", ids=ids)) == len(ids)
+
+
+def test_coalesce_queries(genes_db, monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from visyn_core import manager
+    from visyn_core.security.model import User
+
+    connector, _ = genes_db
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+    run_count = db._run_count
+
+    def slow_run_count(*args):
+        calls.append(args)
+        started.set()
+        release.wait(5)
+        return run_count(*args)
+
+    monkeypatch.setattr(db, "_run_count", slow_run_count)
+    args = MultiDict({"filter_chromosome": "1"})
+    with ThreadPoolExecutor(4) as executor:
+        first = executor.submit(db.get_count, "test_genes", "genes", args)
+        started.wait(5)
+        others = [executor.submit(db.get_count, "test_genes", "genes", args) for _ in range(3)]
+        while db.query_coalescer().stats()["shared"] < 3:
+            release.wait(0.001)
+        release.set()
+        assert [f.result() for f in [first, *others]] == [20] * 4
+    assert len(calls) == 1
+    assert len(db.query_coalescer()) == 0
+
+    # the result of a security callable may differ per user
+    user = threading.local()
+    monkeypatch.setattr(type(manager.security), "current_user", property(lambda self: getattr(user, "value", None)))
+    monkeypatch.setattr(connector.views["genes"], "security", lambda u: True)
+
+    def as_user(name):
+        user.value = User(id=name)
+        return db._security_identity(connector.views["genes"])
+
+    assert as_user("alice") != as_user("bob")
+    assert as_user("alice") == as_user("alice")
@@ -0,0 +1,479 @@
+import importlib.util
+import json
+
+import pytest
+
+
+def test_stream_filtered_data(db_client):
+    r = db_client.get("/api/tdp/db/test_genes/genes/filter", params={"filter_chromosome": "1"})
+    streamed = db_client.get("/api/tdp/db/test_genes/genes/filter", params={"filter_chromosome": "1", "_stream": "true"})
+    assert streamed.status_code == 200
+    assert json.loads(streamed.text) == r.json()
+
+    streamed_csv = db_client.get("/api/tdp/db/test_genes/genes.csv", params={"filter_chromosome": "1", "_stream": "true"})
+    lines = streamed_csv.text.splitlines()
+    assert lines[0] == "id\tsymbol\tchromosome\tstrand\tscore"
+    assert lines[1] == "ENSG00000\tGENE0\t1\t0\t0.0"
+    assert len(lines) == 21
+
+
+def test_list_views_readiness(db_client, monkeypatch):
+    import threading
+
+    from tdp_core import db
+
+    release = threading.Event()
+    fill_up = db._fill_up_columns
+    monkeypatch.setattr(db, "_fill_up_columns", lambda v, e: release.wait(5) and fill_up(v, e))
+
+    # the listing doesn't wait for the columns but starts deriving them
+    r = db_client.get("/api/tdp/db/test_genes/")
+    assert r.status_code == 200
+    assert {v["name"]: v["columns_readiness"] for v in r.json()}["genes"] == "deriving"
+    release.set()
+    db.resolve_view("test_genes", "genes")
+    r = db_client.get("/api/tdp/db/test_genes/")
+    assert {v["name"]: v["columns_readiness"] for v in r.json()}["genes"] == "ready"
+
+
+def test_csv_format(db_client):
+    import gzip
+
+    r = db_client.get("/api/tdp/db/test_genes/genes.csv", params={"filter_chromosome": "1"})
+    assert r.headers["content-type"].startswith("text/csv")
+    lines = r.text.splitlines()
+    assert lines[:2] == ["id\tsymbol\tchromosome\tstrand\tscore", "ENSG00000\tGENE0\t1\t0\t0.0"]
+    assert len(lines) == 21
+
+    r = db_client.get("/api/tdp/db/test_genes/genes.csv", params={"filter_chromosome": "1", "_delimiter": "comma"})
+    assert r.text.splitlines()[1] == "ENSG00000,GENE0,1,0,0.0"
+
+    r = db_client.get("/api/tdp/db/test_genes/genes.csv.gz", params={"filter_chromosome": "1"})
+    assert r.headers["content-type"] == "application/gzip"
+    assert gzip.decompress(r.content).decode("utf-8").splitlines() == lines
+
+    # the header is the union of the keys of all rows, not only the ones of the first batch
+    from tdp_core.formatter import _format_csv
+    from tdp_core.sql import app
+
+    rows = [{"id": i} for i in range(1500)] + [{"id": 1500, "extra": "x"}]
+    with app.test_request_context():
+        lines = _format_csv(rows).get_data(as_text=True).splitlines()
+    assert lines[0] == "id\textra"
+    assert lines[1] == "0\t"
+    assert lines[-1] == "1500\tx"
+
+
+def test_arrow_formats(db_client):
+    import io
+
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    params = {"filter_chromosome": "1"}
+    # categorical columns are dictionary encoded strings
+    expected = [{**row, "strand": str(row["strand"])} for row in db_client.get("/api/tdp/db/test_genes/genes/filter", params=params).json()]
+
+    r = db_client.get("/api/tdp/db/test_genes/genes.arrow/filter", params=params)
+    table = pa.ipc.open_stream(r.content).read_all()
+    assert table.to_pylist() == expected
+    assert table.schema.field("score").type == pa.float64()
+    assert pa.types.is_dictionary(table.schema.field("chromosome").type)
+
+    r = db_client.get("/api/tdp/db/test_genes/genes.parquet/filter", params={**params, "_stream": "true"})
+    assert pq.read_table(io.BytesIO(r.content)).to_pylist() == expected
+
+
+def test_arrow_schema_drift():
+    from tdp_core.formatter import _iter_arrow
+
+    pa = pytest.importorskip("pyarrow")
+
+    def read(*batches):
+        return pa.ipc.open_stream(b"".join(_iter_arrow(batches))).read_all()
+
+    # all null batches don't fix the type of a column
+    table = read([{"a": None, "b": 1}], [{"a": 5, "b": 2}])
+    assert table.schema.field("a").type == pa.int64()
+    assert table.to_pylist() == [{"a": None, "b": 1}, {"a": 5, "b": 2}]
+    assert read([{"a": None}]).schema.field("a").type == pa.string()
+    # lossless conversions are fine, others are rejected instead of truncating the values
+    assert read([{"a": 1}], [{"a": 2.0}]).column("a").to_pylist() == [1, 2]
+    with pytest.raises(ValueError, match="without loss"):
+        read([{"a": 1}], [{"a": 1.5}])
+    with pytest.raises(ValueError, match="don't match"):
+        read([{"a": 1}], [{"a": "x"}])
+
+
+def test_columns_format(db_client):
+    r = db_client.get("/api/tdp/db/test_genes/genes.columns.json", params={"filter_chromosome": ["1", "2"]}).json()
+    assert r["id"][:2] == ["ENSG00000", "ENSG00001"]
+    assert r["chromosome"]["dictionary"] == ["1", "2"]
+    assert r["chromosome"]["codes"][:4] == [0, 1, 0, 1]
+    assert len(r["score"]) == 40
+    assert (
+        db_client.get("/api/tdp/db/test_genes/genes", params={"filter_chromosome": "1", "_format": "columns"}).json()["symbol"][0]
+        == "GENE0"
+    )
+    # every column needs all rows
+    assert db_client.get("/api/tdp/db/test_genes/genes.columns.json", params={"_stream": "true"}).status_code == 400
+    assert db_client.get("/api/tdp/db/test_genes/genes", params={"_format": "columns", "_stream": "true"}).status_code == 400
+
+    # the columns are the union of the keys of all rows
+    from tdp_core.formatter import _to_columns
+
+    assert _to_columns([{"id": 1}, {"id": 2, "extra": 3.0}]) == {"id": [1, 2], "extra": [None, 3.0]}
+
+
+def test_page(db_client):
+    params = {"filter_chromosome": "1", "_limit": 5, "_offset": 10, "_sort": "-score"}
+    r = db_client.get("/api/tdp/db/test_genes/genes/page", params=params).json()
+    assert r["total"] == 20
+    assert [row["id"] for row in r["rows"]] == ["ENSG00045", "ENSG00040", "ENSG00035", "ENSG00030", "ENSG00025"]
+
+    # pages are recorded in the view stats
+    genes = db_client.get("/api/tdp/db/_stats").json()["views"]["test_genes"]["genes"]
+    assert genes["query_time"]["count"] == 1
+    assert genes["rows"]["max"] == 5
+    assert genes["count_time"]["count"] == 1
+    assert genes["bytes"]["count"] == 1
+
+    # pages of an undefined order aren't stable
+    params.pop("_sort")
+    assert db_client.get("/api/tdp/db/test_genes/genes/page", params=params).status_code == 400
+
+
+def test_page_without_limit(db_client):
+    params = {"filter_chromosome": "1", "_offset": 15, "_sort": "-score"}
+    r = db_client.get("/api/tdp/db/test_genes/genes/page", params=params)
+    assert r.status_code == 200
+    assert r.json()["total"] == 20
+    assert [row["id"] for row in r.json()["rows"]] == ["ENSG00020", "ENSG00015", "ENSG00010", "ENSG00005", "ENSG00000"]
+
+
+def test_keyset_pagination(db_client):
+    params = {"filter_chromosome": "2", "_sort": "-score", "_limit": 8}
+    ids = []
+    while True:
+        r = db_client.get("/api/tdp/db/test_genes/genes/filter", params=params)
+        ids.extend(row["id"] for row in r.json())
+        if "X-Continuation-Token" not in r.headers:
+            break
+        params["_after"] = r.headers["X-Continuation-Token"]
+    assert len(ids) == 20
+    assert ids[:2] == ["ENSG00096", "ENSG00091"]
+    assert ids[-1] == "ENSG00001"
+
+    assert db_client.get("/api/tdp/db/test_genes/genes/filter", params={"_sort": "score;drop"}).status_code == 400
+
+    from tdp_core.db import encode_keyset_token
+
+    for token in [encode_keyset_token([1, 2], 3), encode_keyset_token(1, {"a": 1}), "invalid"]:
+        params = {"_sort": "score", "_limit": 8, "_after": token}
+        assert db_client.get("/api/tdp/db/test_genes/genes/filter", params=params).status_code == 400
+
+
+@pytest.mark.parametrize("sort", ["strand", "-strand", "chromosome"])
+def test_keyset_pagination_duplicates(db_client, genes_db, sort):
+    import sqlalchemy
+
+    _, engine = genes_db
+    with engine.begin() as conn:  # rows without sort value come last
+        conn.execute(sqlalchemy.text("UPDATE genes SET strand = NULL, chromosome = NULL WHERE ensg IN ('ENSG00003', 'ENSG00050')"))
+
+    params = {"_sort": sort, "_limit": 8}
+    rows = []
+    while True:
+        r = db_client.get("/api/tdp/db/test_genes/genes/filter", params=params)
+        assert r.status_code == 200
+        rows.extend(r.json())
+        if "X-Continuation-Token" not in r.headers:
+            break
+        params["_after"] = r.headers["X-Continuation-Token"]
+    ids = [row["id"] for row in rows]
+    assert len(ids) == 100
+    assert len(set(ids)) == 100
+    column = sort.lstrip("-")
+    values = [row[column] for row in rows]
+    assert values[-2:] == [None, None]
+    assert values[:-2] == sorted(values[:-2], reverse=sort.startswith("-"))
+
+    streamed = db_client.get("/api/tdp/db/test_genes/genes/filter", params={"_sort": sort, "_stream": "true"})
+    assert [row["id"] for row in json.loads(streamed.text)] == ids
+    assert db_client.get("/api/tdp/db/test_genes/genes/filter", params={"_sort": sort, "_limit": 8, "_stream": "true"}).status_code == 400
+
+
+def test_compression(db_client, monkeypatch):
+    from werkzeug.datastructures import MultiDict
+
+    from tdp_core import db
+    from tdp_core.settings import get_settings
+
+    monkeypatch.setattr(get_settings().db.result_cache, "enabled", True)
+    monkeypatch.setattr(db, "_result_cache", None)
+
+    url = "/api/tdp/db/test_genes/genes/filter"
+    plain = db_client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    r = db_client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.json() == plain.json()
+
+    # the cached result keeps the compressed body
+    rows, _ = db.get_filtered_data("test_genes", "genes", MultiDict())
+    assert [key for key, _ in rows.payloads] == [("_format_json", None)]
+    assert db_client.get(url, headers={"Accept-Encoding": "gzip"}).json() == plain.json()
+    # the stats record the uncompressed size of cached compressed bodies as well
+    bytes_stats = db_client.get("/api/tdp/db/_stats").json()["views"]["test_genes"]["genes"]["bytes"]
+    assert bytes_stats["count"] == 3
+    assert bytes_stats["p50"] == bytes_stats["max"] == len(plain.content)
+
+    streamed = db_client.get(url, params={"_stream": "true"}, headers={"Accept-Encoding": "gzip"})
+    assert streamed.headers["content-encoding"] == "gzip"
+    assert streamed.json() == plain.json()
+
+    # small responses are not compressed
+    r = db_client.get("/api/tdp/db/test_genes/genes/count", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in r.headers
+
+
+def test_etags(db_client, genes_db, monkeypatch):
+    from tdp_core import db
+
+    r = db_client.get("/api/tdp/db/test_genes/genes/desc")
+    etag = r.headers["etag"]
+    assert db_client.get("/api/tdp/db/test_genes/genes/desc", headers={"If-None-Match": etag}).status_code == 304
+
+    # etag of the response body
+    r = db_client.get("/api/tdp/db/test_genes/genes/filter", params={"filter_chromosome": "1"}, headers={"Accept-Encoding": "identity"})
+    etag = r.headers["etag"]
+    r = db_client.get("/api/tdp/db/test_genes/genes/filter", params={"filter_chromosome": "1"}, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert "etag" not in db_client.get("/api/tdp/db/test_genes/genes_no_cache/filter").headers
+
+    # the 304 of a compressed representation has the same validator as its 200
+    r = db_client.get("/api/tdp/db/test_genes/genes/filter", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    etag = r.headers["etag"]
+    assert etag.endswith('-gzip"')
+    r = db_client.get("/api/tdp/db/test_genes/genes/filter", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["etag"] == etag
+
+    # etag of the data version, answered without running the query
+    monkeypatch.setattr(genes_db[0], "data_version", "v1")
+    etag = db_client.get("/api/tdp/db/test_genes/genes/filter").headers["etag"]
+    monkeypatch.setattr(db, "get_filtered_data", None)
+    assert db_client.get("/api/tdp/db/test_genes/genes/filter", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_batch(db_client):
+    queries = [
+        {"database": "test_genes", "view": "genes", "args": {"filter_chromosome": ["1", "2"]}},
+        {"database": "test_genes", "view": "genes", "type": "count", "args": {"filter_chromosome": "1"}},
+        {"database": "test_genes", "view": "genes_items", "type": "lookup", "args": {"query": "GENE1", "column": "symbol", "limit": 5}},
+        {"database": "test_genes", "view": "genes", "type": "desc"},
+        {"database": "test_genes", "view": "unknown"},
+    ]
+    r = db_client.post("/api/tdp/db/_batch", json=queries)
+    assert r.status_code == 200
+    filtered, count, lookup, desc, unknown = r.json()
+    assert filtered["data"] == db_client.get("/api/tdp/db/test_genes/genes/filter", params={"filter_chromosome": ["1", "2"]}).json()
+    assert count == {"status": 200, "data": 20}
+    assert lookup["data"]["more"] is True
+    assert [item["text"] for item in lookup["data"]["items"]] == ["GENE1", "GENE10", "GENE11", "GENE12", "GENE13"]
+    assert desc["data"]["name"] == "genes"
+    assert unknown["status"] == 404
+
+    assert db_client.post("/api/tdp/db/_batch", json={"database": "test_genes"}).status_code == 400
+
+
+def test_async_api(db_client):
+    params = {"filter_chromosome": ["1", "2"]}
+    expected = db_client.get("/api/tdp/db/test_genes/genes/filter", params=params).json()
+    # uses the synchronous implementation in a thread pool if aiosqlite is not installed
+    assert db_client.get("/api/tdp/async/db/test_genes/genes/filter", params=params).json() == expected
+    assert db_client.post("/api/tdp/async/db/test_genes/genes/count", data=params).json() == 40
+
+    lookup_params = {"query": "GENE1", "column": "symbol", "limit": 5}
+    expected = db_client.get("/api/tdp/db/test_genes/genes_items/lookup", params=lookup_params).json()
+    assert db_client.get("/api/tdp/async/db/test_genes/genes_items/lookup", params=lookup_params).json() == expected
+
+    assert db_client.get("/api/tdp/async/db/test_genes/unknown/filter").status_code == 404
+
+    from tdp_core import sql_async
+
+    assert (sql_async.async_engine("test_genes") is not None) == (importlib.util.find_spec("aiosqlite") is not None)
+
+
+def test_async_api_list_parameters(db_client, monkeypatch):
+    from tdp_core import db, sql_async
+
+    if sql_async.async_engine("test_genes") is None:
+        pytest.skip("aiosqlite is not installed")
+    params = {"filter_chromosome": ["1", "2"]}
+    expected = db_client.get("/api/tdp/db/test_genes/genes/filter", params=params).json()
+    view_stats_before = db_client.get("/api/tdp/db/_stats").json()["views"]["test_genes"]["genes"]["query_time"]["count"]
+
+    # lists are expanded for async drivers which can't bind them even if the dialect supports array parameters, e.g. asyncpg
+    monkeypatch.setattr(db, "_supports_sql_parameters", lambda dialect: True)
+    assert db_client.get("/api/tdp/async/db/test_genes/genes/filter", params=params).json() == expected
+    assert db_client.get("/api/tdp/async/db/test_genes/genes/count", params=params).json() == 40
+
+    genes = db_client.get("/api/tdp/db/_stats").json()["views"]["test_genes"]["genes"]
+    assert genes["query_time"]["count"] == view_stats_before + 1
+    assert genes["count_time"]["count"] == 1
+
+
+def test_admission_priority():
+    import threading
+    import time
+
+    from tdp_core.admission import AdmissionController, OverloadedError
+
+    controller = AdmissionController(max_concurrent=1, max_queue=2, queue_timeout=5)
+    controller.acquire()
+    order = []
+
+    def run(priority):
+        controller.acquire(priority)
+        order.append(priority)
+        controller.release()
+
+    threads = [threading.Thread(target=run, args=(priority,)) for priority in ("low", "high")]
+    for t in threads:
+        t.start()
+        while controller.queued < len(order) + threads.index(t) + 1:
+            time.sleep(0.001)
+    with pytest.raises(OverloadedError):
+        controller.acquire()  # queue is full
+    controller.release()
+    for t in threads:
+        t.join()
+    assert order == ["high", "low"]
+    assert controller.stats()["active"] == 0
+    assert controller.stats()["rejected"] == 1
+
+
+def test_admission_overload(db_client, monkeypatch):
+    from tdp_core import admission
+    from tdp_core.admission import AdmissionController
+
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    monkeypatch.setitem(admission._controllers, "test_genes", controller)
+    controller.acquire()
+    r = db_client.get("/api/tdp/db/test_genes/genes/filter")
+    assert r.status_code == 503
+    assert int(r.headers["Retry-After"]) >= 1
+    r = db_client.post("/api/tdp/db/_batch", json=[{"database": "test_genes", "view": "genes", "type": "count"}])
+    assert r.json()[0]["status"] == 503
+
+    controller.release()
+    assert db_client.get("/api/tdp/db/test_genes/genes/filter").status_code == 200
+    assert admission.stats()["test_genes"]["admitted"] == 2
+
+
+def test_admission_slots(db_client, monkeypatch):
+    import threading
+    import time
+
+    from tdp_core import admission, db
+    from tdp_core.admission import AdmissionController
+
+    controller = AdmissionController(max_concurrent=3, max_queue=2, queue_timeout=5)
+    controller.acquire(slots=2)
+    admitted = threading.Event()
+
+    def run():
+        controller.acquire(slots=2)  # waits although one slot is free
+        admitted.set()
+
+    t = threading.Thread(target=run)
+    t.start()
+    while controller.queued < 1:
+        time.sleep(0.001)
+    assert not admitted.is_set()
+    controller.release(2)
+    t.join()
+    assert controller.active == 2
+    controller.release(2)
+    assert controller.active == 0
+
+    # the data and the count query of /page use two connections
+    controller = AdmissionController(max_concurrent=5)
+    monkeypatch.setitem(admission._controllers, "test_genes", controller)
+    get_page = db.get_page
+    active = []
+    monkeypatch.setattr(db, "get_page", lambda *args: active.append(controller.active) or get_page(*args))
+    assert db_client.get("/api/tdp/db/test_genes/genes/page", params={"_limit": 5}).status_code == 200
+    assert active == [2]
+    assert controller.active == 0
+
+
+def test_admission_streamed(db_client, monkeypatch):
+    from tdp_core import admission, db
+    from tdp_core.admission import AdmissionController
+
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    monkeypatch.setitem(admission._controllers, "test_genes", controller)
+    stream_filtered_data = db.stream_filtered_data
+    active = []
+
+    def tracked(*args, **kwargs):
+        batches, view = stream_filtered_data(*args, **kwargs)
+
+        def track():
+            for batch in batches:
+                active.append(controller.active)
+                yield batch
+
+        return track(), view
+
+    monkeypatch.setattr(db, "stream_filtered_data", tracked)
+    r = db_client.get("/api/tdp/db/test_genes/genes/filter", params={"_stream": "true"})
+    assert len(r.json()) == 100
+    # the slot is held while the rows are fetched and released once the response is closed
+    assert active
+    assert all(a == 1 for a in active)
+    assert controller.active == 0
+
+
+def test_view_stats(db_client, monkeypatch):
+    from tdp_core import utils
+    from tdp_core.cache import LRUCache
+
+    monkeypatch.setattr(utils, "_id_mapping_caches", {("Ensembl", "Entrez"): LRUCache(10)})
+    for chromosome in ["1", "2", "3"]:
+        assert db_client.get("/api/tdp/db/test_genes/genes/filter", params={"filter_chromosome": chromosome}).status_code == 200
+    db_client.get("/api/tdp/db/test_genes/genes/count", params={"filter_chromosome": "1"})
+
+    r = db_client.get("/api/tdp/db/_stats")
+    assert r.status_code == 200
+    genes = r.json()["views"]["test_genes"]["genes"]
+    assert genes["query_time"]["count"] == 3
+    assert genes["rows"]["p50"] == 20
+    assert genes["count_time"]["count"] == 1
+    assert genes["bytes"]["max"] > 0
+    assert {"p50", "p95", "p99", "max"} <= set(genes["serialization_time"])
+    slow_queries = r.json()["slow_queries"]
+    assert len(slow_queries) == 2  # the filter queries only differ in their parameters
+    assert slow_queries[0]["duration"] >= slow_queries[1]["duration"]
+    assert r.json()["id_mapping_cache"]["Ensembl -> Entrez"]["hit_rate"] == 0
+
+    from visyn_core.security.model import User
+
+    monkeypatch.setattr(User, "has_role", lambda self, role: False)
+    assert db_client.get("/api/tdp/db/_stats").status_code == 403
+
+
+def test_view_stats_streamed(db_client):
+    r = db_client.get("/api/tdp/db/test_genes/genes/filter", params={"filter_chromosome": "1", "_stream": "true"})
+    assert r.status_code == 200
+
+    # streamed responses are recorded once their body is exhausted
+    genes = db_client.get("/api/tdp/db/_stats").json()["views"]["test_genes"]["genes"]
+    assert genes["query_time"]["count"] == 1
+    assert genes["rows"]["max"] == 20
+    assert genes["bytes"]["max"] == len(r.content)
+    assert genes["serialization_time"]["max"] > 0
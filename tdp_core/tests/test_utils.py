@@ -0,0 +1,33 @@
+from visyn_core import manager
+
+from tdp_core import utils
+
+
+class _FakeMapping:
+    def __init__(self):
+        self.calls = []
+
+    def can_map(self, from_idtype, to_idtype):
+        return True
+
+    def __call__(self, from_idtype, to_idtype, ids):
+        self.calls.append(list(ids))
+        return [[f"{id}_a", f"{id}_b"] if id.endswith("1") else [] if id.endswith("2") else [f"{id}_a"] for id in ids]
+
+
+def test_map_scores_cached(app, monkeypatch):
+    mapping = _FakeMapping()
+    monkeypatch.setattr(manager, "id_mapping", mapping)
+    monkeypatch.setattr(utils, "_id_mapping_caches", {})
+
+    scores = [{"id": "g1", "score": 1}, {"id": "g2", "score": 2}, {"id": "g3", "score": 3}, {"id": "g3", "score": 4}]
+    expected = [{"id": "g1_a", "score": 1}, {"id": "g1_b", "score": 1}, {"id": "g3_a", "score": 3}, {"id": "g3_a", "score": 4}]
+    assert utils.map_scores(scores, "A", "B") == expected
+    assert scores[0] == {"id": "g1", "score": 1}
+
+    # only the new id is mapped, the others are served from the cache
+    assert utils.map_scores([*scores, {"id": "g4", "score": 5}], "A", "B") == [*expected, {"id": "g4_a", "score": 5}]
+    assert mapping.calls == [["g1", "g2", "g3"], ["g4"]]
+    stats = utils.id_mapping_cache_stats()["A -> B"]
+    assert stats["hits"] == 3
+    assert stats["misses"] == 4
@@ -1,10 +1,13 @@
 import json
 import logging
+import threading
 
 from flask import abort, make_response
 from flask.wrappers import Response
 from visyn_core import manager
 
+from .cache import LRUCache
+
 _log = logging.getLogger(__name__)
 
 
@@ -16,6 +19,55 @@ secure_replacements = [
 ]  # has to be part of the computed replacements
 
 
+_id_mapping_caches: dict[tuple[str, str], LRUCache] = {}
+_id_mapping_caches_lock = threading.Lock()
+
+
+def id_mapping_cache(from_idtype, to_idtype) -> LRUCache | None:
+    """
+    returns the lazily created cache of mapped ids for the given pair of idtypes or None if caching is disabled
+    """
+    from .settings import get_settings
+
+    settings = get_settings().id_mapping_cache
+    if not settings.enabled:
+        return None
+    key = (from_idtype, to_idtype)
+    cache = _id_mapping_caches.get(key)
+    if cache is None:
+        with _id_mapping_caches_lock:
+            cache = _id_mapping_caches.setdefault(key, LRUCache(settings.max_entries, settings.ttl))
+    return cache
+
+
+def id_mapping_cache_stats():
+    """
+    :return: dict of "from_idtype -> to_idtype" to the stats of the corresponding cache
+    """
+    return {"{} -> {}".format(*key): cache.stats() for key, cache in list(_id_mapping_caches.items())}
+
+
+def map_ids(from_idtype, to_idtype, ids):
+    """
+    maps the given ids using the id mapping manager, the mapping of each distinct id is cached per pair of idtypes
+    :return: list of mapped ids per given id
+    """
+    cache = id_mapping_cache(from_idtype, to_idtype)
+    if cache is None:
+        return manager.id_mapping(from_idtype, to_idtype, ids)
+
+    unique_ids = list(dict.fromkeys(ids))
+    known = cache.get_many(unique_ids)
+    missing = [id for id in unique_ids if id not in known]
+    if missing:
+        mapped = manager.id_mapping(from_idtype, to_idtype, missing)
+        # the cached lists are shared between calls and must not be modified
+        fresh = dict(zip(missing, (tuple(m) if m else () for m in mapped), strict=True))
+        cache.set_many(fresh)
+        known.update(fresh)
+    return [known[id] for id in ids]
+
+
 def map_scores(scores, from_idtype, to_idtype):
     """
     maps the given scores from idtype to to idtype
@@ -29,17 +81,10 @@ def map_scores(scores, from_idtype, to_idtype):
 
     if not manager.id_mapping.can_map(from_idtype, to_idtype):
         abort(400, "score cannot be mapped to target")
-    mapped_ids = manager.id_mapping(from_idtype, to_idtype, [r["id"] for r in scores])
+    mapped_ids = map_ids(from_idtype, to_idtype, [r["id"] for r in scores])
 
-    mapped_scores = []
-    for score, mapped in zip(scores, mapped_ids, strict=False):
-        if not mapped:
-            continue
-        for target_id in mapped:
-            clone = score.copy()
-            clone["id"] = target_id
-            mapped_scores.append(clone)
-    return mapped_scores
+    # expand in a single pass, one new row per mapped id
+    return [{**score, "id": target_id} for score, mapped in zip(scores, mapped_ids, strict=False) if mapped for target_id in mapped]
 
 
 def clean_query(query):
@@ -81,6 +126,59 @@ def no_cache(f):
     return cache_control("private", "no-cache", "no-store", "max-age=0")(f)
 
 
+_ENCODING_SUFFIXES = ("gzip", "br")  # appended by compression to the etags of compressed representations
+
+
+def _matching_etag(etag):
+    """
+    :return: the tag of the If-None-Match header of the current request matching the given strong etag of any of its encodings or None
+    """
+    from flask import request
+
+    if not request.if_none_match:
+        return None
+    return next(
+        (tag for tag in (etag, *("{}-{}".format(etag, e) for e in _ENCODING_SUFFIXES)) if request.if_none_match.contains(tag)), None
+    )
+
+
+def etag_matches(etag):
+    """
+    whether the If-None-Match header of the current request contains the given strong etag of any of its encodings
+    """
+    return _matching_etag(etag) is not None
+
+
+def not_modified(etag):
+    """
+    :return: an empty 304 response with the etag of the matching representation, e.g. the one with the suffix of its encoding
+    """
+    response = Response(status=304)
+    response.set_etag(_matching_etag(etag) or etag)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def conditional(response, etag=None):
+    """
+    adds a strong etag to the given response and replaces it with a 304 response if the client already has the same version
+    :param response: the response
+    :param etag: the etag, by default a hash of the response body, streamed responses without etag are not changed
+    :return: the response or a 304 response
+    """
+    import hashlib
+
+    response = make_response(response)
+    if etag is None:
+        if response.is_streamed:
+            return response
+        etag = hashlib.sha1(response.get_data()).hexdigest()
+    if etag_matches(etag):
+        return not_modified(etag)
+    response.set_etag(etag)
+    return response
+
+
 def fix_id(id):
     """
     fixes the id such that is it a resource identifier
@@ -110,6 +208,38 @@ def random_id(length):
     return id
 
 
+_json_encoders = None
+
+
+def json_encoders():
+    """
+    returns the encoders of the `json-encoder` extension point, they are only resolved once
+    """
+    global _json_encoders
+    if _json_encoders is None:
+        _json_encoders = [p.load().factory() for p in manager.registry.list("json-encoder")]
+    return _json_encoders
+
+
+def _convert_builtin(o):
+    """
+    converts the non json types of the standard library, same conventions as the numpy `json-encoder`
+    :return: the converted value or the given object if it is not supported
+    """
+    import datetime as dt
+    import decimal
+
+    if isinstance(o, dt.datetime):  # milliseconds since epoch
+        return int(o.timestamp() * 1000)
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if isinstance(o, bytes):
+        return o.decode("utf-8")
+    return o
+
+
 class JSONExtensibleEncoder(json.JSONEncoder):
     """
     json encoder with extension point extensions
@@ -118,18 +248,61 @@ class JSONExtensibleEncoder(json.JSONEncoder):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.encoders = [p.load().factory() for p in manager.registry.list("json-encoder")]
+        self.encoders = json_encoders()
 
     def default(self, o):
         for encoder in self.encoders:
             if o in encoder:
                 return encoder(o, self)
+        converted = _convert_builtin(o)
+        if converted is not o:
+            return converted
         return super().default(o)
 
 
+class _FastJSONDefault(JSONExtensibleEncoder):
+    """
+    default handler of the orjson backend, which is only called for types orjson doesn't support natively
+    """
+
+    def __call__(self, o):
+        return self.default(o)
+
+
+_orjson_dumps = None
+
+
+def _fast_dumps():
+    """
+    returns a function serializing an object to json using orjson or None if the orjson backend is disabled or not installed
+    """
+    global _orjson_dumps
+    if _orjson_dumps is None:
+        from .settings import get_settings
+
+        backend = get_settings().json_backend
+        _orjson_dumps = False
+        if backend != "std":
+            try:
+                import orjson  # type: ignore
+
+                # NaN is serialized as null, numpy arrays and scalars natively and datetimes are passed to the default handler
+                option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                default = _FastJSONDefault()  # passed as base encoder to the `json-encoder` extensions
+
+                def dumps(obj):
+                    return orjson.dumps(obj, default=default, option=option).decode("utf-8")
+
+                _orjson_dumps = dumps
+            except ImportError:
+                if backend == "orjson":
+                    _log.warning("orjson is not installed, falling back to the standard json backend")
+    return _orjson_dumps or None
+
+
 def to_json(obj, *args, **kwargs):
     """
-    convert the given object ot json using the extensible encoder
+    convert the given object ot json using the configured backend (`tdp_core.json_backend`) and the extensible encoder
     :param obj:
     :param args:
     :param kwargs:
@@ -139,11 +312,20 @@ def to_json(obj, *args, **kwargs):
         del kwargs["allow_nan"]
     if "indent" in kwargs:
         del kwargs["indent"]
+
+    fast_dumps = _fast_dumps() if not args and not kwargs else None
+    if fast_dumps:
+        return fast_dumps(obj)
+
     kwargs["ensure_ascii"] = False
 
     # Pandas JSON module has been deprecated and removed. UJson cannot convert numpy arrays, so it cannot be used here. The JSON used here does not support the `double_precision` keyword.
     if isinstance(obj, (float, dict, list)):
-        obj = _handle_nan_values(obj)
+        try:
+            # most results don't contain NaN values, try without converting them first
+            return json.dumps(obj, *args, **kwargs, allow_nan=False, cls=JSONExtensibleEncoder)
+        except ValueError:
+            obj = _handle_nan_values(obj)
     return json.dumps(obj, *args, **kwargs, cls=JSONExtensibleEncoder)
 
 
@@ -0,0 +1,139 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+from .settings import get_settings
+
+_log = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_MAX_PARAMETER_VALUES = 20  # longer list parameters are truncated in the slow query log
+
+_lock = threading.Lock()
+# recorded metrics: query_time and rows of get_data and stream_data, count_time of get_count, lookup_time and rows of lookups, and
+# serialization_time and bytes (uncompressed) of the filter and score responses, see sql._record_response
+_views: dict[tuple[str, str], dict[str, "RollingHistogram"]] = {}
+_slow_queries: dict[str, dict] = {}  # normalized query -> worst execution
+
+
+class RollingHistogram:
+    """
+    keeps the last `window` samples of a metric to compute its percentiles
+    """
+
+    def __init__(self, window=1024):
+        self._samples: deque[float] = deque(maxlen=window)
+        self.count = 0  # total number of samples, including the ones which left the window
+
+    def add(self, value):
+        self._samples.append(value)
+        self.count += 1
+
+    def percentiles(self):
+        """
+        :return: dict with the total count and p50/p95/p99/max of the samples within the window
+        """
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {"count": self.count, "p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99), "max": samples[-1]}
+
+
+def enabled():
+    return get_settings().db.stats.enabled
+
+
+def record(database, view_name, **metrics):
+    """
+    records samples of the given metrics of a view, e.g. record(database, view_name, query_time=0.1, rows=20)
+    """
+    if not enabled():
+        return
+    with _lock:
+        histograms = _views.setdefault((database, view_name), {})
+        for metric, value in metrics.items():
+            if value is None:
+                continue
+            histogram = histograms.get(metric)
+            if histogram is None:
+                histogram = histograms[metric] = RollingHistogram(get_settings().db.stats.window)
+            histogram.add(value)
+
+
+def normalize_query(sql):
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def _parameters(kwargs):
+    return {
+        k: list(v[:_MAX_PARAMETER_VALUES]) + ["..."] if isinstance(v, (list, tuple)) and len(v) > _MAX_PARAMETER_VALUES else v
+        for k, v in kwargs.items()
+    }
+
+
+def record_query(database, view_name, sql, kwargs, duration, rows=None, metric="query_time"):
+    """
+    records the execution of a query of a view and keeps it in the slow query log if it is among the slowest ones
+    :param duration: seconds
+    :param rows: number of resulting rows if any
+    :param metric: name of the time metric, e.g. query_time or count_time
+    """
+    if not enabled():
+        return
+    record(database, view_name, **{metric: duration, "rows": rows})
+
+    settings = get_settings().db.stats
+    if settings.slow_query_threshold and duration >= settings.slow_query_threshold:
+        _log.warning("slow query of %s/%s took %.3fs", database, view_name, duration)
+    if settings.slow_queries <= 0:
+        return
+    query = normalize_query(sql)
+    with _lock:
+        worst = _slow_queries.get(query)
+        if worst is not None and worst["duration"] >= duration:
+            return
+        if worst is None and len(_slow_queries) >= settings.slow_queries:
+            fastest = min(_slow_queries.values(), key=lambda q: q["duration"])
+            if fastest["duration"] >= duration:
+                return
+            del _slow_queries[fastest["query"]]
+        _slow_queries[query] = {
+            "database": database,
+            "view": view_name,
+            "query": query,
+            "parameters": _parameters(kwargs),
+            "duration": duration,
+            "rows": rows,
+            "time": time.time(),
+        }
+
+
+def slow_queries():
+    """
+    :return: the slowest normalized queries with the parameters of their slowest execution, slowest first
+    """
+    with _lock:
+        return sorted(_slow_queries.values(), key=lambda q: q["duration"], reverse=True)
+
+
+def stats():
+    """
+    :return: dict of database to view to metric to its percentiles
+    """
+    with _lock:
+        r: dict[str, dict] = {}
+        for (database, view_name), histograms in _views.items():
+            r.setdefault(database, {})[view_name] = {metric: h.percentiles() for metric, h in histograms.items()}
+        return r
+
+
+def clear():
+    with _lock:
+        _views.clear()
+        _slow_queries.clear()